@@ -1,11 +1,17 @@
 import google.generativeai as genai
 import base64
+import io
 import os
-import json
 import time
 from dotenv import load_dotenv
 import asyncio
-from utils import logger, log_api_request, log_api_response, log_json_data, is_streamlit_cloud
+from contextlib import asynccontextmanager
+import numpy as np
+from PIL import Image
+from moviepy.editor import VideoFileClip
+from utils import logger, log_api_request, log_api_response, log_json_data, is_streamlit_cloud, create_temp_file
+from json_stream import JSONArrayStreamParser
+from profiling import profiled_call
 
 # Get API key from environment
 # Check if we're in Streamlit Cloud first
@@ -27,36 +33,27 @@ else:
 genai.configure(api_key=api_key)
 logger.info("Gemini API configured successfully")
 
-async def analyze_segment(segment_info):
-    """
-    Analyze a video segment to identify potential highlights
-    Returns list of timestamps with highlight moments
-    """
-    segment_path, start_time, end_time = segment_info
-    segment_duration = end_time - start_time
-    
-    logger.info(f"Analyzing segment from {start_time} to {end_time} (duration: {segment_duration}s)")
-    logger.debug(f"Segment file path: {segment_path}")
-    
-    # Create the Gemini 2.0 Flash model
-    model_name = 'gemini-2.0-flash-exp'
-    model = genai.GenerativeModel(model_name)
-    logger.info(f"Using model: {model_name}")
-    
-    # Read the video file as bytes
-    try:
-        with open(segment_path, "rb") as f:
-            video_bytes = f.read()
-        video_size_mb = len(video_bytes) / (1024 * 1024)
-        logger.info(f"Video loaded: {video_size_mb:.2f} MB")
-    except Exception as e:
-        logger.error(f"Failed to read video file: {str(e)}")
-        return []
-    
-    # Convert video to compatible format for the API
-    video_part = {"mime_type": "video/mp4", "data": video_bytes}
-    
-    prompt = """
+
+MODEL_NAME = 'gemini-2.0-flash-exp'
+
+# Analysis modes: upload the encoded segment, or send sampled frames as images
+ANALYSIS_MODES = ('video', 'frames')
+
+DEFAULT_FRAME_OPTIONS = {
+    "sample_fps": 1.0,       # frames sampled per second of footage
+    "max_height": 360,       # frames are downsized to at most this height
+    "jpeg_quality": 70,
+    "include_audio": True,   # attach a low-bitrate audio excerpt of the window
+    "audio_bitrate": "32k"
+}
+
+# Frames decoded at full resolution at a time; only downsized JPEGs are kept
+FRAME_DECODE_BATCH = 16
+
+# Windows sampled at once per process, independent of the API request limit
+FRAME_SAMPLING_CONCURRENCY = int(os.environ.get('FRAME_SAMPLING_CONCURRENCY', '2'))
+
+VIDEO_PROMPT = """
     Analyze this football video segment and identify potential highlight moments.
     Look for:
     1. Goals
@@ -76,99 +73,427 @@ async def analyze_segment(segment_info):
       {"timestamp_seconds": 120.7, "event_type": "Great save", "confidence_score": 0.85}
     ]
     """
+
+FRAMES_PROMPT = """
+    The images above are frames sampled from a football match segment, in order.
+    Each frame is preceded by its timestamp in seconds relative to the start of the segment.
+    An audio excerpt of the same segment may be attached (crowd noise and commentary help).
+    Identify potential highlight moments.
+    Look for:
+    1. Goals
+    2. Near misses
+    3. Great saves
+    4. Skillful plays
+    5. Fouls or cards
+    
+    Return a JSON list of objects with:
+    1. timestamp_seconds (relative to this segment, using the frame timestamps)
+    2. event_type (from the categories above)
+    3. confidence_score (0-1)
+    
+    Example format:
+    [
+      {"timestamp_seconds": 45.2, "event_type": "Goal", "confidence_score": 0.95},
+      {"timestamp_seconds": 120.7, "event_type": "Great save", "confidence_score": 0.85}
+    ]
+    """
+
+# Global analyzer limits shared by every run in this process (None = unlimited)
+_max_concurrency = None
+_min_request_interval = 0
+_request_semaphore = None
+_rate_lock = None
+_next_request_time = 0
+
+def configure_analysis_limits(max_concurrency=None, requests_per_minute=None):
+    """
+    Set a process-wide limit on concurrent API requests and on request rate.
+    Applies to every analysis running in this process, across matches.
+    """
+    global _max_concurrency, _min_request_interval, _request_semaphore, _rate_lock
+    _max_concurrency = max_concurrency
+    _min_request_interval = 60.0 / requests_per_minute if requests_per_minute else 0
+    _request_semaphore = None
+    _rate_lock = None
+    logger.info(f"Analysis limits: max_concurrency={max_concurrency}, requests_per_minute={requests_per_minute}")
+
+@asynccontextmanager
+async def request_slot():
+    """Wait for a free concurrency slot and for the rate limit before sending a request"""
+    global _request_semaphore, _rate_lock, _next_request_time
     
-    log_api_request(model_name, prompt, is_multimodal=True)
-    logger.info("Sending video analysis request to Gemini API...")
+    # Created lazily so they belong to the running event loop
+    if _max_concurrency and _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(_max_concurrency)
+    if _min_request_interval and _rate_lock is None:
+        _rate_lock = asyncio.Lock()
     
-    # Generate content using Gemini 2.0 Flash with timing
-    start_time_api = time.time()
+    if _request_semaphore is not None:
+        await _request_semaphore.acquire()
     try:
-        response = model.generate_content(
-            contents=[video_part, prompt]
-        )
-        elapsed_time = time.time() - start_time_api
-        log_api_response(response.text, elapsed_time)
-    except Exception as e:
-        logger.error(f"Gemini API request failed: {str(e)}")
-        return []
+        if _rate_lock is not None:
+            async with _rate_lock:
+                wait = _next_request_time - time.monotonic()
+                if wait > 0:
+                    logger.debug("Rate limit: waiting %.2fs before next request", wait)
+                    await asyncio.sleep(wait)
+                _next_request_time = time.monotonic() + _min_request_interval
+        yield
+    finally:
+        if _request_semaphore is not None:
+            _request_semaphore.release()
+
+_sampling_semaphores = {}
+
+def _sampling_semaphore():
+    """Semaphore bounding concurrent frame sampling on the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _sampling_semaphores:
+        _sampling_semaphores.clear()
+        _sampling_semaphores[loop] = asyncio.Semaphore(max(1, FRAME_SAMPLING_CONCURRENCY))
+    return _sampling_semaphores[loop]
+
+def downsize_frames(frames, max_height):
+    """
+    Downsize a batch of frames (N, H, W, 3) in one vectorized pass.
+    Uses integer block averaging so the whole batch is reduced with a single reshape.
+    """
+    batch = np.asarray(frames)
+    height, width = batch.shape[1], batch.shape[2]
+    factor = max(1, -(-height // max_height))  # Ceiling division
+    if factor == 1:
+        return batch.astype(np.uint8)
     
-    # Process the response to extract timestamps and events
-    highlights = []
-    logger.info("Parsing response for highlight timestamps")
+    new_h, new_w = height // factor, width // factor
+    batch = batch[:, :new_h * factor, :new_w * factor]
+    batch = batch.reshape(len(batch), new_h, factor, new_w, factor, batch.shape[-1])
+    return batch.mean(axis=(2, 4)).astype(np.uint8)
+
+def encode_jpeg_batch(frames, quality=70):
+    """JPEG-encode a batch of uint8 frames; returns list of bytes"""
+    encoded = []
+    for frame in frames:
+        buffer = io.BytesIO()
+        Image.fromarray(frame).save(buffer, format='JPEG', quality=quality)
+        encoded.append(buffer.getvalue())
+    return encoded
+
+def sample_frames(video_path, start_time, end_time, options=None):
+    """
+    Sample frames from video_path between start_time and end_time (seconds in that file).
+    Returns (frames, audio_bytes) where frames is a list of (relative_time, jpeg_bytes).
+    audio_bytes is None unless options["include_audio"] is set and the video has audio.
+    """
+    options = {**DEFAULT_FRAME_OPTIONS, **(options or {})}
+    sample_start = time.time()
     
+    clip = VideoFileClip(video_path, audio=options["include_audio"])
     try:
-        # Get the text response and try to find a JSON structure
-        response_text = response.text.strip()
+        end_time = min(end_time, clip.duration)
+        step = 1.0 / options["sample_fps"]
+        relative_times = np.arange(0, end_time - start_time, step)
         
-        # Attempt to find JSON in the response
-        json_start = response_text.find('[')
-        json_end = response_text.rfind(']') + 1
+        if len(relative_times) == 0:
+            return [], None
         
-        if json_start >= 0 and json_end > json_start:
-            logger.info("JSON structure found in response")
-            json_str = response_text[json_start:json_end]
-            
+        # Decode in small batches so at most FRAME_DECODE_BATCH full-resolution frames are held
+        frames = []
+        for batch_start in range(0, len(relative_times), FRAME_DECODE_BATCH):
+            batch_times = relative_times[batch_start:batch_start + FRAME_DECODE_BATCH]
+            raw_frames = [clip.get_frame(start_time + t) for t in batch_times]
+            small_frames = downsize_frames(raw_frames, options["max_height"])
+            del raw_frames
+            jpegs = encode_jpeg_batch(small_frames, options["jpeg_quality"])
+            frames.extend(zip((float(t) for t in batch_times), jpegs))
+        
+        audio_bytes = None
+        if options["include_audio"] and clip.audio is not None:
+            audio_path = create_temp_file(suffix=".mp3")
             try:
-                highlights_data = json.loads(json_str)
-                log_json_data(highlights_data, "Parsed highlights data:")
-                
-                for idx, highlight in enumerate(highlights_data):
-                    if "timestamp_seconds" in highlight:
-                        relative_time = float(highlight["timestamp_seconds"])
-                        global_time = start_time + relative_time
-                        event_type = highlight.get("event_type", "Unknown")
-                        confidence = highlight.get("confidence_score", 0)
-                        
-                        highlights.append(global_time)
-                        logger.info(f"Highlight #{idx+1}: {event_type} at {global_time:.2f}s (confidence: {confidence})")
-                    else:
-                        logger.warning(f"Skipping highlight {idx+1}: missing timestamp_seconds field")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON: {str(e)}")
-                logger.debug(f"Problematic JSON string: {json_str}")
-        else:
-            logger.warning("No JSON structure found in response. Falling back to text parsing.")
-            # Fallback to parsing text if no JSON is found
-            for line_num, line in enumerate(response_text.split('\n')):
-                if 'seconds' in line and ':' in line:
-                    try:
-                        time_part = line.split(':')[1].split(',')[0].strip()
-                        if time_part.replace('.', '', 1).isdigit():
-                            relative_time = float(time_part)
-                            global_time = start_time + relative_time
-                            highlights.append(global_time)
-                            logger.info(f"Highlight found in line {line_num+1} at {global_time:.2f}s")
-                    except Exception as e:
-                        logger.warning(f"Failed to parse line {line_num+1}: {str(e)}")
-                        continue
+                clip.audio.subclip(start_time, end_time).write_audiofile(
+                    audio_path,
+                    fps=16000,
+                    bitrate=options["audio_bitrate"],
+                    logger=None
+                )
+                with open(audio_path, "rb") as f:
+                    audio_bytes = f.read()
+            finally:
+                if os.path.exists(audio_path):
+                    os.remove(audio_path)
+    finally:
+        clip.close()
+    
+    logger.info(f"Sampled {len(frames)} frames from {start_time:.1f}-{end_time:.1f}s in {time.time() - sample_start:.2f}s")
+    return frames, audio_bytes
+
+def build_frame_contents(frames, audio_bytes, prompt):
+    """Build the multimodal request: timestamped images, optional audio, then the prompt"""
+    contents = []
+    for relative_time, jpeg in frames:
+        contents.append(f"t={relative_time:.1f}s")
+        contents.append({"mime_type": "image/jpeg", "data": jpeg})
+    if audio_bytes:
+        contents.append({"mime_type": "audio/mp3", "data": audio_bytes})
+    contents.append(prompt)
+    return contents
+
+def record_error(stats):
+    """Count a failed segment in stats, if stats are being collected"""
+    if stats is not None:
+        stats["errors"] = stats.get("errors", 0) + 1
+
+def highlight_to_event(highlight, start_time, idx):
+    """Convert one parsed highlight object to a global-time event dict, or None"""
+    if "timestamp_seconds" not in highlight:
+        logger.warning(f"Skipping highlight {idx+1}: missing timestamp_seconds field")
+        return None
+    try:
+        relative_time = float(highlight["timestamp_seconds"])
+    except (TypeError, ValueError):
+        logger.warning(f"Skipping highlight {idx+1}: invalid timestamp_seconds {highlight['timestamp_seconds']!r}")
+        return None
+    
+    global_time = start_time + relative_time
+    event_type = highlight.get("event_type", "Unknown")
+    confidence = highlight.get("confidence_score", 0)
+    logger.info(f"Highlight #{idx+1}: {event_type} at {global_time:.2f}s (confidence: {confidence})")
+    return {"timestamp": global_time, "event_type": event_type, "confidence": confidence}
+
+def parse_text_highlights(response_text, start_time):
+    """Fallback for responses without a JSON array: look for 'seconds: N' lines"""
+    events = []
+    for line_num, line in enumerate(response_text.split('\n')):
+        if 'seconds' in line and ':' in line:
+            try:
+                time_part = line.split(':')[1].split(',')[0].strip()
+                if time_part.replace('.', '', 1).isdigit():
+                    relative_time = float(time_part)
+                    global_time = start_time + relative_time
+                    events.append({"timestamp": global_time, "event_type": "Unknown", "confidence": 0})
+                    logger.info(f"Highlight found in line {line_num+1} at {global_time:.2f}s")
+            except Exception as e:
+                logger.warning(f"Failed to parse line {line_num+1}: {str(e)}")
+                continue
+    return events
+
+def parse_highlights(response_text, start_time):
+    """
+    Extract highlight events from a complete model response.
+    Relative timestamps are mapped to global time (start_time + relative_time).
+    Returns list of dicts with timestamp, event_type and confidence.
+    """
+    logger.info("Parsing response for highlight timestamps")
+    
+    parser = JSONArrayStreamParser()
+    items = parser.feed(response_text) + parser.close()
+    if not parser.found_array:
+        logger.warning("No JSON structure found in response. Falling back to text parsing.")
+        return parse_text_highlights(response_text, start_time)
+    
+    log_json_data(items, "Parsed highlights data:")
+    events = [highlight_to_event(item, start_time, idx) for idx, item in enumerate(items)]
+    return [event for event in events if event]
+
+async def prepare_request(segment_info, mode='video', frame_options=None, source_window=False, profile_dir=None):
+    """
+    Build the request contents for a segment.
+    Returns (contents, prompt, bytes_sent), or None if the segment cannot be read.
+    profile_dir: profile frame sampling as part of the "analyze" stage, in the
+        thread where it runs (see profiling.profiled_call)
+    """
+    segment_path, start_time, end_time = segment_info
+    segment_duration = end_time - start_time
+    
+    if mode == 'frames':
+        # Sample timestamped frames (and optionally audio) instead of uploading the video
+        try:
+            window_start = start_time if source_window else 0
+            async with _sampling_semaphore():
+                frames, audio_bytes = await asyncio.to_thread(
+                    profiled_call, "analyze", profile_dir, sample_frames,
+                    segment_path, window_start, window_start + segment_duration, frame_options
+                )
+        except Exception as e:
+            logger.error(f"Failed to sample frames: {str(e)}")
+            return None
+        
+        if not frames:
+            logger.warning("No frames sampled from segment")
+            return None
+        
+        prompt = FRAMES_PROMPT
+        contents = build_frame_contents(frames, audio_bytes, prompt)
+        bytes_sent = sum(len(jpeg) for _, jpeg in frames) + len(audio_bytes or b"")
+        logger.info(f"Frame batch prepared: {len(frames)} frames, {bytes_sent / (1024 * 1024):.2f} MB")
+        return contents, prompt, bytes_sent
+    
+    # Read the video file as bytes
+    try:
+        with open(segment_path, "rb") as f:
+            video_bytes = f.read()
+        video_size_mb = len(video_bytes) / (1024 * 1024)
+        logger.info(f"Video loaded: {video_size_mb:.2f} MB")
     except Exception as e:
-        logger.error(f"Error parsing highlight timestamps: {str(e)}")
+        logger.error(f"Failed to read video file: {str(e)}")
+        return None
     
-    logger.info(f"Found {len(highlights)} highlights in segment {start_time}-{end_time}")
-    return highlights
+    # Convert video to compatible format for the API
+    video_part = {"mime_type": "video/mp4", "data": video_bytes}
+    return [video_part, VIDEO_PROMPT], VIDEO_PROMPT, len(video_bytes)
 
-async def analyze_all_segments(segment_infos):
-    """Analyze all segments in parallel"""
-    logger.info(f"Starting analysis of {len(segment_infos)} video segments in parallel")
+async def stream_segment_events(segment_info, mode='video', frame_options=None, source_window=False, stats=None,
+                                profile_dir=None):
+    """
+    Analyze a video segment and yield highlight events (global time) as soon as
+    each one is complete in the streamed model response.
     
-    tasks = [analyze_segment(segment_info) for segment_info in segment_infos]
+    mode: 'video' uploads the encoded segment, 'frames' sends sampled frames
+    source_window: segment_path is the full source video and only
+        start_time..end_time of it is analyzed (frames mode only)
+    stats: optional dict that accumulates bytes_sent, api_seconds, requests and
+        errors (segments that could not be prepared or whose request failed)
+    profile_dir: optional profile directory for frame sampling (see prepare_request)
+    """
+    segment_path, start_time, end_time = segment_info
+    segment_duration = end_time - start_time
+    
+    logger.info(f"Analyzing segment from {start_time} to {end_time} (duration: {segment_duration}s, mode: {mode})")
+    logger.debug("Segment file path: %s", segment_path)
+    
+    # Create the Gemini 2.0 Flash model
+    model_name = MODEL_NAME
+    model = genai.GenerativeModel(model_name)
+    logger.info(f"Using model: {model_name}")
+    
+    request = await prepare_request(segment_info, mode, frame_options, source_window, profile_dir)
+    if request is None:
+        record_error(stats)
+        return
+    contents, prompt, bytes_sent = request
+    
+    log_api_request(model_name, prompt, is_multimodal=True)
+    logger.info("Sending video analysis request to Gemini API...")
+    
+    parser = JSONArrayStreamParser()
+    # Only text before the JSON array is kept (for the text fallback), plus a bounded log excerpt
+    preamble = []
+    response_excerpt = []
+    excerpt_length = 0
+    response_length = 0
+    found = 0
+    
+    # Generate content using Gemini 2.0 Flash with timing
+    async with request_slot():
+        start_time_api = time.time()
+        try:
+            response = await model.generate_content_async(
+                contents=contents,
+                stream=True
+            )
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. the final finish-reason chunk)
+                    continue
+                response_length += len(text)
+                if excerpt_length < 1000:
+                    response_excerpt.append(text)
+                    excerpt_length += len(text)
+                if not parser.found_array:
+                    preamble.append(text)
+                
+                for item in parser.feed(text):
+                    event = highlight_to_event(item, start_time, found)
+                    found += 1
+                    if event:
+                        yield event
+            
+            for item in parser.close():
+                event = highlight_to_event(item, start_time, found)
+                found += 1
+                if event:
+                    yield event
+            
+            elapsed_time = time.time() - start_time_api
+            log_api_response(''.join(response_excerpt), elapsed_time)
+            logger.debug("API Response length: %s characters", response_length)
+        except Exception as e:
+            logger.error(f"Gemini API request failed: {str(e)}")
+            record_error(stats)
+            return
+        finally:
+            if stats is not None:
+                stats["bytes_sent"] = stats.get("bytes_sent", 0) + bytes_sent
+                stats["api_seconds"] = stats.get("api_seconds", 0) + (time.time() - start_time_api)
+                stats["requests"] = stats.get("requests", 0) + 1
+    
+    if not parser.found_array:
+        logger.warning("No JSON structure found in response. Falling back to text parsing.")
+        for event in parse_text_highlights(''.join(preamble), start_time):
+            yield event
+    elif parser.malformed:
+        logger.warning(f"Segment {start_time}-{end_time}: {parser.malformed} malformed elements skipped, {parser.parsed} parsed")
+
+async def analyze_segment_events(segment_info, mode='video', frame_options=None, source_window=False, stats=None,
+                                 on_event=None, profile_dir=None):
+    """
+    Analyze a video segment to identify potential highlights
+    Returns list of event dicts (timestamp, event_type, confidence) in global time
+    
+    on_event: optional callback invoked with each event as soon as it is parsed
+    """
+    events = []
+    async for event in stream_segment_events(segment_info, mode, frame_options, source_window, stats, profile_dir):
+        events.append(event)
+        if on_event:
+            on_event(event)
+    
+    logger.info(f"Found {len(events)} highlights in segment {segment_info[1]}-{segment_info[2]}")
+    return events
+
+async def analyze_segment(segment_info, mode='video', frame_options=None, source_window=False, stats=None):
+    """
+    Analyze a video segment to identify potential highlights
+    Returns list of timestamps with highlight moments
+    """
+    events = await analyze_segment_events(segment_info, mode, frame_options, source_window, stats)
+    return [event["timestamp"] for event in events]
+
+async def analyze_all_segment_events(segment_infos, mode='video', frame_options=None, source_windows=False, stats=None,
+                                     on_event=None, profile_dir=None):
+    """
+    Analyze all segments in parallel, returning events sorted by timestamp
+    on_event: optional callback invoked with each event as soon as any segment produces it
+    """
+    logger.info(f"Starting analysis of {len(segment_infos)} video segments in parallel (mode: {mode})")
+    
+    tasks = [analyze_segment_events(segment_info, mode, frame_options, source_windows, stats, on_event, profile_dir)
+             for segment_info in segment_infos]
     
     try:
         results = await asyncio.gather(*tasks)
         
         # Flatten the list of highlights
-        all_highlights = []
-        for i, highlight_list in enumerate(results):
+        all_events = []
+        for i, event_list in enumerate(results):
             segment_start = segment_infos[i][1]
             segment_end = segment_infos[i][2]
-            logger.info(f"Segment {i+1} ({segment_start}-{segment_end}s): {len(highlight_list)} highlights")
-            all_highlights.extend(highlight_list)
+            logger.info(f"Segment {i+1} ({segment_start}-{segment_end}s): {len(event_list)} highlights")
+            all_events.extend(event_list)
         
         # Sort highlights by timestamp
-        sorted_highlights = sorted(all_highlights)
-        logger.info(f"Total highlights found across all segments: {len(sorted_highlights)}")
+        sorted_events = sorted(all_events, key=lambda event: event["timestamp"])
+        logger.info(f"Total highlights found across all segments: {len(sorted_events)}")
         
-        return sorted_highlights
+        return sorted_events
     except Exception as e:
         logger.error(f"Failed to analyze all segments: {str(e)}")
-        return [] 
\ No newline at end of file
+        record_error(stats)
+        return []
+
+async def analyze_all_segments(segment_infos, mode='video', frame_options=None, source_windows=False, stats=None):
+    """Analyze all segments in parallel"""
+    events = await analyze_all_segment_events(segment_infos, mode, frame_options, source_windows, stats)
+    return [event["timestamp"] for event in events]
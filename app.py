@@ -6,7 +6,9 @@ import time
 import threading
 from dotenv import load_dotenv
 from controller_agent import process_video
-from utils import logger, save_uploaded_file, FOLDERS, is_streamlit_cloud
+from utils import logger, save_uploaded_file, FOLDERS, is_streamlit_cloud, create_output_dir, tail_log, latest_log_file
+from artifact_store import register_artifact, release_all_intermediates, touch_artifact, total_bytes, QUOTA_BYTES
+from media_server import start_media_server, media_url
 
 # First check for Streamlit secrets
 api_key = None
@@ -44,6 +46,35 @@ progress_data = {
     "percent": 0
 }
 
+# How much of the latest log file the UI shows
+LOG_TAIL_KB = 64
+
+def video_url(path):
+    """Media server URL for a video, or None when it has to go through Streamlit"""
+    try:
+        return media_url(path)
+    except ValueError:
+        return None
+
+def show_video(path):
+    """Play a video, streamed by the media server when it is available"""
+    touch_artifact(path)
+    st.video(video_url(path) or path)
+
+def show_download(path, file_name):
+    """Download link streamed by the media server, or Streamlit's download button"""
+    url = video_url(path)
+    if url:
+        st.markdown(f'<a href="{url}" download="{file_name}">Download Highlights Video</a>', unsafe_allow_html=True)
+        return
+    with open(path, "rb") as file:
+        st.download_button(
+            label="Download Highlights Video",
+            data=file,
+            file_name=file_name,
+            mime="video/mp4"
+        )
+
 # Function to update progress from background threads
 def update_progress(step, message, percent):
     progress_data["step"] = step
@@ -55,6 +86,13 @@ def main():
     """Main Streamlit application function"""
     logger.info("Starting Streamlit application")
     
+    # With MEDIA_BASE_URL set, videos are streamed from disk by the media server
+    # instead of Streamlit's in-memory media store
+    try:
+        start_media_server()
+    except OSError as e:
+        logger.error(f"Failed to start media server, serving videos through Streamlit: {str(e)}")
+    
     st.set_page_config(
         page_title="Football Highlights Generator",
         page_icon="⚽",
@@ -84,6 +122,24 @@ def main():
         st.write("Your videos and highlights are stored in the following locations:")
         for folder_name, folder_path in FOLDERS.items():
             st.code(f"{folder_name}: {folder_path}")
+        quota = f" of {QUOTA_BYTES / (1024 * 1024):.0f} MB" if QUOTA_BYTES > 0 else ""
+        st.write(f"Disk usage: {total_bytes() / (1024 * 1024):.1f} MB{quota}")
+    
+    # Analysis mode is chosen per run
+    analysis_mode_label = st.sidebar.radio(
+        "Analysis mode",
+        ["Video segments", "Sampled frames"],
+        help="Sampled frames sends downsized JPEG frames plus an audio excerpt instead of whole video segments. Much cheaper for long matches."
+    )
+    analysis_mode = "frames" if analysis_mode_label == "Sampled frames" else "video"
+    two_pass = st.sidebar.checkbox(
+        "Coarse-to-fine (two-pass)",
+        help="Scan a low-resolution proxy of the whole match first, then re-analyze only short windows around candidate moments."
+    )
+    stream_output = st.sidebar.checkbox(
+        "Stream highlights as they render (HLS)",
+        help="Publish each highlight clip to an HLS playlist as soon as it is encoded, so playback can start after the first clip."
+    )
     
     # File uploader - increase size limit for Streamlit Cloud
     max_size_mb = 500 if is_streamlit_cloud() else 200
@@ -109,10 +165,17 @@ def main():
             st.error(f"File size ({file_size_mb:.2f}MB) exceeds the maximum allowed size ({max_size_mb}MB)")
             st.stop()
         
-        # Save uploaded file to our uploads folder
+        # Save uploaded file to our uploads folder (once per upload, not on every rerun)
         try:
-            file_path = save_uploaded_file(uploaded_file)
-            logger.info(f"File saved to: {file_path}")
+            upload_key = (uploaded_file.name, uploaded_file.size)
+            saved = st.session_state.get("saved_upload")
+            if saved and saved[0] == upload_key and os.path.exists(saved[1]):
+                file_path = saved[1]
+            else:
+                file_path = save_uploaded_file(uploaded_file)
+                register_artifact(file_path, kind='uploads')
+                st.session_state.saved_upload = (upload_key, file_path)
+                logger.info(f"File saved to: {file_path}")
         except Exception as e:
             logger.error(f"Failed to save uploaded file: {str(e)}")
             st.error("Failed to process your uploaded file. Please try again.")
@@ -120,7 +183,7 @@ def main():
         
         # Show the uploaded video
         st.subheader("Uploaded Video")
-        st.video(file_path)
+        show_video(file_path)
         
         # Process button
         if st.button("Generate Highlights"):
@@ -157,7 +220,25 @@ def main():
                     update_progress(1, "Segmenting video...", 5)
                     
                     # Process the video
-                    result = loop.run_until_complete(process_video(file_path, update_progress))
+                    # HLS output is published before processing so players can start on the first clip
+                    output_format = "hls" if stream_output else "mp4"
+                    output_dir = None
+                    if stream_output:
+                        output_dir = create_output_dir()
+                        playlist_path = os.path.join(output_dir, "playlist.m3u8")
+                        playlist_url = video_url(playlist_path)
+                        if playlist_url:
+                            st.info(f"Live highlights playlist (plays as soon as the first clip is ready): [{playlist_url}]({playlist_url})")
+                        else:
+                            st.info(f"Live highlights playlist (open in VLC or ffplay as soon as the first clip is ready): {playlist_path}")
+                    
+                    result = loop.run_until_complete(process_video(
+                        file_path, update_progress,
+                        analysis_mode=analysis_mode,
+                        two_pass=two_pass,
+                        output_format=output_format,
+                        output_dir=output_dir
+                    ))
                     
                     # Set progress to complete
                     update_progress(3, "Processing complete!", 100)
@@ -185,16 +266,8 @@ def main():
                     # Display highlights video
                     if result["highlights_video"]:
                         st.subheader("Highlights Video")
-                        st.video(result["highlights_video"])
-                        
-                        # Add download button
-                        with open(result["highlights_video"], "rb") as file:
-                            st.download_button(
-                                label="Download Highlights Video",
-                                data=file,
-                                file_name="football_highlights.mp4",
-                                mime="video/mp4"
-                            )
+                        show_video(result["highlights_video"])
+                        show_download(result["highlights_video"], "football_highlights.mp4")
                     else:
                         st.warning("Could not create highlights video")
                     
@@ -203,6 +276,11 @@ def main():
                     st.write(f"Total processing time: {processing_time:.2f} seconds")
                     st.write(f"Video segments created: {len(result['segments'])}")
                     st.write(f"Highlights detected: {len(result['highlight_timestamps'])}")
+                    if result.get("two_pass"):
+                        for pass_name in ("coarse", "fine"):
+                            pass_stats = result["analysis_stats"].get(pass_name, {})
+                            st.write(f"{pass_name.capitalize()} pass API time: {pass_stats.get('api_seconds', 0):.2f} seconds "
+                                     f"({pass_stats.get('requests', 0)} requests)")
                     
                     # Log completion
                     logger.info(f"Highlight generation completed successfully in {processing_time:.2f}s")
@@ -215,29 +293,20 @@ def main():
                     # Clean up any resources we might have created
                     loop.close()
 
-    # Show logging information at the bottom
+    # Show logging information at the bottom (only the tail of the latest log)
     with st.expander("Application Logs", expanded=False):
-        # Create a file handler for Streamlit UI
-        if os.path.exists('logs'):
-            log_files = [f for f in os.listdir('logs') if f.endswith('.log')]
-            if log_files:
-                latest_log = max(log_files, key=lambda x: os.path.getmtime(os.path.join('logs', x)))
-                log_path = os.path.join('logs', latest_log)
-                
-                with open(log_path, 'r') as f:
-                    log_content = f.read()
-                st.text_area("Log Output", log_content, height=400)
-            else:
-                st.text("No log files found")
+        log_path = latest_log_file()
+        if log_path:
+            st.text_area(f"Log Output (last {LOG_TAIL_KB} KB)", tail_log(log_path, LOG_TAIL_KB * 1024), height=400)
         else:
-            st.text("Logging directory not created yet")
+            st.text("No log files found")
 
 # Cleanup temporary files when the app is closed
 def cleanup():
     logger.info("Cleaning up temporary files")
     try:
-        # We no longer need to delete files since we're storing them in specific folders
-        pass
+        # Outputs and uploads are bounded by the artifact quota; segments are never needed again
+        release_all_intermediates()
     except Exception as e:
         logger.error(f"Failed to clean up temporary files: {str(e)}")
 
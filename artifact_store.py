@@ -0,0 +1,234 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from utils import FOLDERS, logger, forget_probe
+
+# Byte quota for everything under FOLDERS (0 disables quota enforcement)
+QUOTA_BYTES = int(float(os.environ.get('ARTIFACT_QUOTA_MB', '5120')) * 1024 * 1024)
+
+# Only finished outputs and old uploads are evicted; segments are released per run
+EVICTABLE_KINDS = ('output', 'uploads')
+
+# Segments left behind by crashed or failed runs (found on disk, not written by a run
+# of this process) are deleted once unmodified for this long
+STALE_SEGMENT_SECONDS = float(os.environ.get('STALE_SEGMENT_HOURS', '6')) * 3600
+
+# path -> {"run_id", "kind", "size", "last_access", "readers"}; paths may be files or output directories.
+# run_id is None for files adopted from earlier processes; readers are active runs using the file as input.
+_artifacts = {}
+_active_runs = set()
+_lock = threading.RLock()
+_scanned = False
+
+def _path_size(path):
+    """Size of a file, or total size of the files in a directory"""
+    if os.path.isdir(path):
+        total = 0
+        for root, _, names in os.walk(path):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    return os.path.getsize(path)
+
+def _scan_existing():
+    """Track files left behind by earlier processes so the quota covers them too"""
+    global _scanned
+    if _scanned:
+        return
+    _scanned = True
+
+    for kind, folder in FOLDERS.items():
+        try:
+            names = os.listdir(folder)
+        except OSError as e:
+            logger.warning(f"Could not scan {folder}: {str(e)}")
+            continue
+
+        for name in names:
+            path = os.path.abspath(os.path.join(folder, name))
+            if path in _artifacts:
+                continue
+            try:
+                _artifacts[path] = {
+                    "run_id": None,
+                    "kind": kind,
+                    "size": _path_size(path),
+                    "last_access": os.path.getmtime(path)
+                }
+            except OSError:
+                continue
+    logger.info(f"Artifact store tracking {len(_artifacts)} existing files")
+
+def new_run_id():
+    """Return a short unique identifier for a processing run"""
+    return uuid.uuid4().hex[:8]
+
+def begin_run(run_id, inputs=()):
+    """
+    Mark a run as active so its artifacts are never evicted. Tracked files in
+    inputs (e.g. the upload being processed) are protected until the run ends.
+    """
+    with _lock:
+        _scan_existing()
+        _active_runs.add(run_id)
+        for path in inputs:
+            info = _artifacts.get(os.path.abspath(path))
+            if info is not None:
+                info.setdefault("readers", set()).add(run_id)
+                info["last_access"] = time.time()
+    logger.debug("Artifact run started: %s", run_id)
+
+def end_run(run_id):
+    """Mark a run as finished so its outputs and inputs become eligible for eviction"""
+    with _lock:
+        _active_runs.discard(run_id)
+        for info in _artifacts.values():
+            info.get("readers", set()).discard(run_id)
+    logger.debug("Artifact run finished: %s", run_id)
+
+def register_artifact(path, run_id=None, kind='segments'):
+    """Start tracking a file (or output directory) written for a run; returns the path"""
+    try:
+        size = _path_size(path)
+    except OSError:
+        size = 0
+
+    with _lock:
+        _scan_existing()
+        _artifacts[os.path.abspath(path)] = {
+            "run_id": run_id,
+            "kind": kind,
+            "size": size,
+            "last_access": time.time()
+        }
+    logger.debug("Registered %s artifact for run %s: %s (%s bytes)", kind, run_id, path, size)
+    return path
+
+def touch_artifact(path):
+    """Mark a tracked file (or the tracked output directory containing it) as recently used"""
+    path = os.path.abspath(path)
+    with _lock:
+        while path not in _artifacts:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return
+            path = parent
+        _artifacts[path]["last_access"] = time.time()
+
+def _delete(path):
+    """Remove a file from disk and from the index; returns bytes freed"""
+    info = _artifacts.pop(path, None)
+    size = info["size"] if info else 0
+    forget_probe(path)
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Failed to delete artifact {path}: {str(e)}")
+        return 0
+    return size
+
+def release_intermediates(run_id):
+    """Delete the intermediate segments of a run; returns bytes freed"""
+    with _lock:
+        paths = [path for path, info in _artifacts.items()
+                 if info["run_id"] == run_id and info["kind"] == 'segments']
+        freed = sum(_delete(path) for path in paths)
+
+    if paths:
+        logger.info(f"Released {len(paths)} intermediate files for run {run_id} ({freed / (1024 * 1024):.2f} MB)")
+    return freed
+
+def release_all_intermediates():
+    """
+    Delete the intermediate segments of every run of this process.
+    Segments adopted from disk are left alone: another process may still be analyzing them.
+    """
+    with _lock:
+        paths = [path for path, info in _artifacts.items()
+                 if info["kind"] == 'segments' and info["run_id"] is not None]
+        freed = sum(_delete(path) for path in paths)
+
+    if paths:
+        logger.info(f"Released {len(paths)} intermediate files ({freed / (1024 * 1024):.2f} MB)")
+    return freed
+
+def release_stale_intermediates(max_age=None):
+    """
+    Delete segments adopted from disk that have not been modified for max_age
+    seconds (default STALE_SEGMENT_SECONDS). Another process's live segments
+    are recent, so only leftovers of crashed or failed runs are removed.
+    Returns bytes freed.
+    """
+    max_age = STALE_SEGMENT_SECONDS if max_age is None else max_age
+    now = time.time()
+    with _lock:
+        _scan_existing()
+        paths = []
+        for path, info in _artifacts.items():
+            if info["kind"] != 'segments' or info["run_id"] is not None:
+                continue
+            try:
+                if now - os.path.getmtime(path) >= max_age:
+                    paths.append(path)
+            except OSError:
+                paths.append(path)
+        freed = sum(_delete(path) for path in paths)
+
+    if paths:
+        logger.info(f"Released {len(paths)} stale intermediate files ({freed / (1024 * 1024):.2f} MB)")
+    return freed
+
+def total_bytes():
+    """Return the number of bytes currently tracked"""
+    with _lock:
+        _scan_existing()
+        return sum(info["size"] for info in _artifacts.values())
+
+def enforce_quota(quota_bytes=None):
+    """
+    Evict least recently used outputs and uploads until usage fits the quota.
+    Artifacts that belong to or are read by an active run are never evicted.
+    Segments left behind by crashed runs are released first (see release_stale_intermediates).
+    Returns the number of bytes freed by quota eviction.
+    """
+    release_stale_intermediates()
+
+    quota = QUOTA_BYTES if quota_bytes is None else quota_bytes
+    if quota <= 0:
+        return 0
+
+    with _lock:
+        _scan_existing()
+        used = sum(info["size"] for info in _artifacts.values())
+        if used <= quota:
+            return 0
+
+        candidates = sorted(
+            (info["last_access"], path) for path, info in _artifacts.items()
+            if info["kind"] in EVICTABLE_KINDS and info["run_id"] not in _active_runs
+            and not info.get("readers")
+        )
+
+        freed = 0
+        evicted = 0
+        for _, path in candidates:
+            if used - freed <= quota:
+                break
+            freed += _delete(path)
+            evicted += 1
+
+    logger.info(f"Quota enforcement evicted {evicted} files ({freed / (1024 * 1024):.2f} MB), "
+                f"usage {(used - freed) / (1024 * 1024):.2f} MB of {quota / (1024 * 1024):.2f} MB")
+    if used - freed > quota:
+        logger.warning("Artifact usage still exceeds quota; remaining files belong to active runs or are intermediates")
+    return freed
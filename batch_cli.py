@@ -0,0 +1,177 @@
+"""
+Headless batch runner: process many matches with shared encode and analyzer budgets.
+
+Usage:
+    python batch_cli.py matches/ --results-dir results/ --encode-workers 4 --max-requests 8
+    python batch_cli.py manifest.txt --requests-per-minute 60 --analysis-mode frames
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from controller_agent import process_video, run_blocking, VIDEO_EXTENSIONS
+from analysis_agent import configure_analysis_limits
+from highlights_agent import DEFAULT_VARIANTS
+from utils import logger, get_video_duration, worker_log_queue, init_worker_logging
+
+def load_inputs(source):
+    """
+    Return the list of video paths to process.
+    source is a directory (every video in it), a JSON manifest (list of paths
+    or of objects with a "path" key) or a text manifest (one path per line).
+    """
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source)
+                      if name.lower().endswith(VIDEO_EXTENSIONS))
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        if source.endswith('.json'):
+            entries = [entry["path"] if isinstance(entry, dict) else entry for entry in json.load(f)]
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    # Relative manifest entries are relative to the manifest itself
+    return [entry if os.path.isabs(entry) else os.path.join(base_dir, entry) for entry in entries]
+
+def result_paths(results_dir, videos):
+    """
+    Return {video path: JSON results file}. Files are named after the video,
+    with a hash of its full path added when several videos share a name.
+    Raises ValueError if the same video is listed twice.
+    """
+    names = {}
+    for video_path in videos:
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        names.setdefault(name, []).append(video_path)
+
+    paths = {}
+    for name, same_name in names.items():
+        for video_path in same_name:
+            if video_path in paths:
+                raise ValueError(f"{video_path} is listed more than once")
+            if len(same_name) > 1:
+                digest = hashlib.sha1(os.path.abspath(video_path).encode()).hexdigest()[:8]
+                paths[video_path] = os.path.join(results_dir, f"{name}-{digest}.json")
+            else:
+                paths[video_path] = os.path.join(results_dir, f"{name}.json")
+    return paths
+
+async def process_match(video_path, result_path, args, executor, match_slots):
+    """Process one match and write its JSON results; returns a summary row"""
+    async with match_slots:
+        logger.info(f"Batch: starting {video_path}")
+        start = time.time()
+        try:
+            # Probing spawns ffmpeg; keep it off the loop shared by all matches
+            duration = await run_blocking(None, get_video_duration, video_path)
+        except Exception:
+            duration = 0
+
+        result = await process_video(
+            video_path,
+            analysis_mode=args.analysis_mode,
+            two_pass=args.two_pass,
+            executor=executor,
+            profile=args.profile,
+            variants=DEFAULT_VARIANTS if args.variants else None
+        )
+        elapsed = time.time() - start
+
+        result["video_duration"] = duration
+        result["wall_time"] = elapsed
+        try:
+            with open(result_path, "w") as f:
+                json.dump(result, f, indent=2, default=str)
+        except Exception as e:
+            logger.error(f"Batch: failed to write results for {video_path}: {str(e)}")
+            result.update(success=False, error=f"Failed to write {result_path}: {str(e)}")
+
+        status = "ok" if result.get("success") else f"failed: {result.get('error')}"
+        logger.info(f"Batch: finished {video_path} in {elapsed:.2f}s ({status})")
+        return {
+            "video": video_path,
+            "success": bool(result.get("success")),
+            "error": result.get("error"),
+            "duration": duration,
+            "wall_time": elapsed,
+            "highlights": len(result.get("highlight_timestamps", []))
+        }
+
+def failed_row(video_path, error):
+    """Summary row for a match that did not produce a result"""
+    return {"video": video_path, "success": False, "error": error, "duration": 0, "wall_time": 0, "highlights": 0}
+
+async def run_batch(videos, results, args):
+    """Run every match concurrently against one encode pool and one analyzer budget"""
+    configure_analysis_limits(args.max_requests, args.requests_per_minute)
+    match_slots = asyncio.Semaphore(args.max_matches)
+
+    # Workers log through this process so only it writes and rotates the log file
+    with ProcessPoolExecutor(max_workers=args.encode_workers, initializer=init_worker_logging,
+                             initargs=(worker_log_queue(),)) as executor:
+        outcomes = await asyncio.gather(*(process_match(video, results[video], args, executor, match_slots)
+                                          for video in videos), return_exceptions=True)
+
+    # One crashed match must not discard the rows of the others
+    rows = []
+    for video, outcome in zip(videos, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(f"Batch: {video} failed: {str(outcome)}", exc_info=outcome)
+            outcome = failed_row(video, str(outcome))
+        rows.append(outcome)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate football highlights for many matches")
+    parser.add_argument("source", help="Directory of videos or manifest file (.txt / .json)")
+    parser.add_argument("--results-dir", default="results", help="Where per-match JSON results are written")
+    parser.add_argument("--encode-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Processes shared by all matches for segment and highlight encoding")
+    parser.add_argument("--max-requests", type=int, default=8,
+                        help="Concurrent analyzer requests across all matches")
+    parser.add_argument("--requests-per-minute", type=float, default=None,
+                        help="Analyzer request rate limit across all matches")
+    parser.add_argument("--max-matches", type=int, default=4, help="Matches in flight at once")
+    parser.add_argument("--analysis-mode", choices=("video", "frames"), default="video")
+    parser.add_argument("--two-pass", action="store_true", help="Use coarse-to-fine analysis")
+    parser.add_argument("--variants", action="store_true",
+                        help="Render full reel, 60s social cut and per-event clips from one decode")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help="Write per-stage cProfile/tracemalloc profiles for every match")
+    args = parser.parse_args()
+
+    videos = load_inputs(args.source)
+    if not videos:
+        parser.error(f"No videos found in {args.source}")
+    videos = [os.path.normpath(video) for video in videos]
+    try:
+        results = result_paths(args.results_dir, videos)
+    except ValueError as e:
+        parser.error(str(e))
+    os.makedirs(args.results_dir, exist_ok=True)
+    logger.info(f"Batch: {len(videos)} matches, {args.encode_workers} encode workers, "
+                f"{args.max_requests} concurrent requests")
+
+    start = time.time()
+    rows = asyncio.run(run_batch(videos, results, args))
+    wall_time = time.time() - start
+
+    succeeded = [row for row in rows if row["success"]]
+    video_seconds = sum(row["duration"] for row in succeeded)
+    print(f"Processed {len(succeeded)}/{len(rows)} matches in {wall_time:.1f}s")
+    print(f"Footage processed: {video_seconds / 60:.1f} min "
+          f"({video_seconds / wall_time:.1f}x realtime, {len(succeeded) / wall_time * 3600:.1f} matches/hour)")
+    print(f"Highlights found: {sum(row['highlights'] for row in succeeded)}")
+    for row in rows:
+        if not row["success"]:
+            print(f"FAILED: {row['video']}: {row['error']} (see {results[row['video']]})")
+    if len(succeeded) < len(rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compare analysis modes on one video: bytes sent to the API and latency.
+
+Usage:
+    python benchmark.py path/to/match.mp4 [--segment-length 300] [--sample-fps 1.0]
+"""
+import argparse
+import asyncio
+import time
+from segmentation_agent import segment_video, plan_segments
+from analysis_agent import analyze_all_segments
+from artifact_store import new_run_id, register_artifact, release_intermediates
+from utils import logger
+
+async def run_mode(video_path, mode, segment_length, frame_options):
+    """Run segmentation and analysis for one mode; returns a result row"""
+    run_id = new_run_id()
+    stats = {}
+    start = time.time()
+    try:
+        if mode == "frames":
+            segments = plan_segments(video_path, segment_length)
+        else:
+            segments = segment_video(video_path, segment_length)
+            for segment_path, _, _ in segments:
+                register_artifact(segment_path, run_id, kind='segments')
+        prepare_time = time.time() - start
+
+        highlights = await analyze_all_segments(
+            segments,
+            mode=mode,
+            frame_options=frame_options,
+            source_windows=(mode == "frames"),
+            stats=stats
+        )
+    finally:
+        release_intermediates(run_id)
+
+    return {
+        "mode": mode,
+        "segments": len(segments),
+        "highlights": len(highlights),
+        "bytes_sent": stats.get("bytes_sent", 0),
+        "api_seconds": stats.get("api_seconds", 0),
+        "prepare_seconds": prepare_time,
+        "total_seconds": time.time() - start
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark video vs sampled-frame analysis")
+    parser.add_argument("video_path")
+    parser.add_argument("--segment-length", type=int, default=300)
+    parser.add_argument("--sample-fps", type=float, default=1.0)
+    parser.add_argument("--max-height", type=int, default=360)
+    parser.add_argument("--no-audio", action="store_true", help="Do not attach audio excerpts in frames mode")
+    args = parser.parse_args()
+
+    frame_options = {
+        "sample_fps": args.sample_fps,
+        "max_height": args.max_height,
+        "include_audio": not args.no_audio
+    }
+
+    rows = []
+    for mode in ("video", "frames"):
+        logger.info(f"Benchmarking analysis mode: {mode}")
+        rows.append(asyncio.run(run_mode(args.video_path, mode, args.segment_length, frame_options)))
+
+    print(f"{'mode':<8}{'segments':>10}{'highlights':>12}{'MB sent':>10}{'API s':>10}{'prepare s':>11}{'total s':>10}")
+    for row in rows:
+        print(f"{row['mode']:<8}{row['segments']:>10}{row['highlights']:>12}"
+              f"{row['bytes_sent'] / (1024 * 1024):>10.2f}{row['api_seconds']:>10.2f}"
+              f"{row['prepare_seconds']:>11.2f}{row['total_seconds']:>10.2f}")
+
+    video_row, frames_row = rows
+    if video_row["bytes_sent"]:
+        ratio = frames_row["bytes_sent"] / video_row["bytes_sent"]
+        print(f"Frames mode sent {ratio:.1%} of the bytes of video mode")
+
+if __name__ == "__main__":
+    main()
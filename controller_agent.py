@@ -1,26 +1,431 @@
 import asyncio
+import functools
+import os
 import time
-from segmentation_agent import segment_video
-from analysis_agent import analyze_all_segments
-from highlights_agent import create_highlights
-from utils import logger
+from segmentation_agent import segment_video, plan_segments
+from analysis_agent import analyze_all_segment_events, MODEL_NAME
+from highlights_agent import create_highlights, append_highlights, create_highlights_hls, render_variants, main_variant_output
+from utils import logger, probe_video, create_output_dir
+from highlight_index import record_events, match_events
+from profiling import profiling_enabled, create_profile_dir, profile_stage, profiled_call, summarize_profiles
+from artifact_store import (new_run_id, begin_run, end_run, register_artifact,
+                            release_intermediates, enforce_quota)
 
-async def process_video(video_path, progress_callback=None):
+# Coarse pass: a heavily downsampled proxy of the whole match in large segments
+COARSE_PASS = {
+    "segment_length": 900,
+    "max_height": 144,
+    "fps": 5,
+    "audio_bitrate": "32k",
+    "sample_fps": 0.2  # frames mode
+}
+
+# Fine pass: short full-resolution windows around coarse candidates
+FINE_PASS = {
+    "window_seconds": 30,
+    "min_confidence": 0.3,
+    "sample_fps": 2.0  # frames mode
+}
+
+async def run_blocking(executor, func, *args, **kwargs):
+    """
+    Run a blocking encode step in an executor so it does not stall the event loop.
+    executor=None uses the loop's default thread pool; batch runs share a process pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+async def prepare_segments(video_path, run_id, analysis_mode, segment_length=300, windows=None,
+                           executor=None, profile_dir=None, **encode_options):
+    """
+    Produce segment infos for analysis.
+    Video mode encodes segments in the executor (registered as intermediates of
+    run_id); frames mode only plans windows over the source.
+    """
+    if analysis_mode == "frames":
+        # Frames are sampled straight from the source, so nothing needs encoding
+        if windows is not None:
+            return [(video_path, start, end) for start, end in windows]
+        return plan_segments(video_path, segment_length)
+    
+    segments = await run_blocking(executor, profiled_call, "segment", profile_dir, segment_video,
+                                  video_path, segment_length, windows=windows, **encode_options)
+    for segment_path, _, _ in segments:
+        register_artifact(segment_path, run_id, kind='segments')
+    return segments
+
+def candidate_windows(events, window_seconds, min_confidence):
+    """Merge windows of window_seconds centred on each candidate event; returns sorted (start, end) list"""
+    windows = []
+    half = window_seconds / 2
+    for event in sorted(events, key=lambda event: event["timestamp"]):
+        try:
+            confidence = float(event.get("confidence") or 0)
+        except (TypeError, ValueError):
+            confidence = 0
+        if confidence < min_confidence:
+            continue
+        
+        start, end = max(0, event["timestamp"] - half), event["timestamp"] + half
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+async def index_events(video_path, events, analysis_mode, partial=False):
+    """
+    Persist events so later queries and reel rebuilds skip analysis. partial marks
+    results of a run in which some segments failed (see highlight_index.record_events).
+    Indexing errors are logged and never fail the run.
+    """
+    try:
+        # Hashing a large file must not block the event loop (hashlib releases the GIL)
+        await run_blocking(None, record_events, video_path, events, MODEL_NAME, analysis_mode, partial=partial)
+    except Exception as e:
+        logger.error(f"Failed to index highlight events for {video_path}: {str(e)}")
+
+async def analyze_coarse_to_fine(video_path, run_id, analysis_mode="video", frame_options=None, executor=None,
+                                 profile_dir=None):
+    """
+    Two-pass analysis: scan the whole match cheaply, then re-analyze only short
+    windows around the coarse candidates at full resolution.
+    Returns (events, stats) where stats holds per-pass bytes, requests and API seconds.
+    """
+    stats = {"coarse": {}, "fine": {}}
+    is_frames = analysis_mode == "frames"
+    
+    # Pass 1: downsampled proxy in large segments
+    coarse_start = time.time()
+    coarse_segments = await prepare_segments(
+        video_path, run_id, analysis_mode,
+        segment_length=COARSE_PASS["segment_length"],
+        executor=executor,
+        profile_dir=profile_dir,
+        **({} if is_frames else {
+            "max_height": COARSE_PASS["max_height"],
+            "fps": COARSE_PASS["fps"],
+            "audio_bitrate": COARSE_PASS["audio_bitrate"]
+        })
+    )
+    coarse_options = {**(frame_options or {}), "sample_fps": COARSE_PASS["sample_fps"], "max_height": COARSE_PASS["max_height"]}
+    coarse_events = await analyze_all_segment_events(
+        coarse_segments, mode=analysis_mode, frame_options=coarse_options,
+        source_windows=is_frames, stats=stats["coarse"], profile_dir=profile_dir
+    )
+    release_intermediates(run_id)
+    stats["coarse"]["seconds"] = time.time() - coarse_start
+    logger.info(f"Coarse pass: {len(coarse_events)} candidates from {len(coarse_segments)} segments "
+                f"({stats['coarse'].get('api_seconds', 0):.2f}s API time)")
+    
+    # Pass 2: full resolution around candidates
+    windows = candidate_windows(coarse_events, FINE_PASS["window_seconds"], FINE_PASS["min_confidence"])
+    if not windows:
+        logger.info("Coarse pass found no candidates above the confidence threshold; skipping fine pass")
+        return [], stats
+    
+    fine_start = time.time()
+    fine_segments = await prepare_segments(video_path, run_id, analysis_mode, windows=windows,
+                                           executor=executor, profile_dir=profile_dir)
+    fine_options = {**(frame_options or {}), "sample_fps": FINE_PASS["sample_fps"]}
+    fine_events = await analyze_all_segment_events(
+        fine_segments, mode=analysis_mode, frame_options=fine_options,
+        source_windows=is_frames, stats=stats["fine"], profile_dir=profile_dir
+    )
+    release_intermediates(run_id)
+    stats["fine"]["seconds"] = time.time() - fine_start
+    logger.info(f"Fine pass: {len(fine_events)} highlights from {len(windows)} windows "
+                f"({stats['fine'].get('api_seconds', 0):.2f}s API time)")
+    
+    return fine_events, stats
+
+# Live mode: follow a growing recording or a directory of recorded chunks
+LIVE_OPTIONS = {
+    "segment_length": 60,    # analyze new footage in windows of this length
+    "poll_interval": 5,      # seconds between checks for new footage
+    "idle_timeout": 60,      # stop when nothing new arrives for this long
+    "settle_seconds": 10,    # a chunk file unchanged for this long is complete
+    "buffer_seconds": 5      # clip buffer; growing files keep this much unread at the tail
+}
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.ts')
+
+def _live_paths(source):
+    """Video files of a live source in recording order"""
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source)
+                      if name.lower().endswith(VIDEO_EXTENSIONS))
+    return [source] if os.path.exists(source) else []
+
+def live_source_state(source):
+    """
+    Size and mtime of every file of a live source, including files that cannot
+    be probed yet. Any change means footage is still arriving.
+    """
+    state = []
+    for path in _live_paths(source):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        state.append((path, stat.st_size, stat.st_mtime_ns))
+    return state
+
+def scan_live_sources(source, settle_seconds, unreadable=None):
+    """
+    Return [(path, duration, complete)] for a live source in recording order.
+    A directory is a sequence of chunks (sorted by name): every chunk but the
+    last is complete, the last one once it has not changed for settle_seconds.
+    A single file is a growing recording and is never complete on its own.
+    unreadable: optional set of paths already reported as unreadable, so each
+        one is warned about once until it becomes readable
+    """
+    unreadable = set() if unreadable is None else unreadable
+    paths = _live_paths(source)
+    sources = []
+    for i, path in enumerate(paths):
+        try:
+            duration = probe_video(path)["duration"] or 0
+        except Exception as e:
+            # Partially written files (e.g. MP4 without moov yet, or Matroska
+            # without a duration) cannot be probed
+            if path not in unreadable:
+                unreadable.add(path)
+                logger.warning(f"Live source not readable (yet): {path} ({str(e)})")
+            break
+        unreadable.discard(path)
+        if os.path.isdir(source):
+            complete = i < len(paths) - 1 or time.time() - os.path.getmtime(path) >= settle_seconds
+        else:
+            complete = False
+        sources.append((path, duration, complete))
+    return sources
+
+async def process_live_video(source, progress_callback=None, analysis_mode="video", frame_options=None,
+                             live_options=None, highlight_callback=None, executor=None, profile=None):
+    """
+    Incrementally process a recording that is still being written.
+    
+    Args:
+        source: A growing MPEG-TS file (containers that only record their
+            duration when finalized, such as MP4 or MKV, cannot be read while
+            growing) or a directory that receives recorded chunks
+        progress_callback: Optional callback function to report progress (step, message, percent)
+        analysis_mode: "video" or "frames", as in process_video
+        frame_options: Optional overrides for frame sampling
+        live_options: Optional overrides for LIVE_OPTIONS
+        highlight_callback: Optional callback (new_timestamps, all_timestamps, reel_path)
+            called every time new highlights have been appended to the reel
+        executor: Optional executor for encode work (see run_blocking)
+        profile: Profile each stage (see profiling.profiling_enabled)
+    """
+    options = {**LIVE_OPTIONS, **(live_options or {})}
+    logger.info(f"Starting live highlight detection for: {source} (analysis mode: {analysis_mode})")
+    start_time_total = time.time()
+    
+    run_id = new_run_id()
+    begin_run(run_id)
+    logger.info(f"Run id: {run_id}")
+    profile_dir = create_profile_dir(run_id) if profiling_enabled(profile) else None
+    
+    def update_progress(step, message, percent):
+        if progress_callback:
+            progress_callback(step, message, percent)
+        logger.debug("Progress: Step %s, %s%%, %s", step, percent, message)
+    
+    processed = {}   # path -> local seconds already analyzed
+    offsets = {}     # path -> global time of the start of that path
+    path_events = {} # path -> events in local time, indexed once the run completes
+    path_errors = {} # path -> segments that failed analysis
+    next_offset = 0
+    highlight_timestamps = []
+    analysis_stats = {}
+    reel_path = None
+    last_activity = time.time()
+    last_state = None
+    unreadable = set()
+    ever_readable = False
+    finishing = False
+    
+    try:
+        while True:
+            # Growing files and new chunks count as activity even before they can be analyzed
+            state = live_source_state(source)
+            if state != last_state:
+                last_state = state
+                last_activity = time.time()
+            
+            sources = scan_live_sources(source, options["settle_seconds"], unreadable)
+            ever_readable = ever_readable or bool(sources)
+            progressed = False
+            
+            for path, duration, complete in sources:
+                complete = complete or finishing
+                if path not in offsets:
+                    offsets[path] = next_offset
+                done = processed.get(path, 0)
+                
+                # Keep the clip buffer unread at the tail of a growing file
+                ready_end = duration if complete else duration - options["buffer_seconds"]
+                windows = []
+                while ready_end - done >= options["segment_length"] or (complete and ready_end - done > 0.5):
+                    end = min(done + options["segment_length"], ready_end)
+                    windows.append((done, end))
+                    done = end
+                
+                if windows:
+                    update_progress(2, f"Analyzing {path} {windows[0][0]:.0f}-{windows[-1][1]:.0f}s...", 50)
+                    segments = await prepare_segments(path, run_id, analysis_mode, windows=windows,
+                                                      executor=executor, profile_dir=profile_dir)
+                    errors_before = analysis_stats.get("errors", 0)
+                    with profile_stage("analyze", profile_dir, cpu=False):
+                        events = await analyze_all_segment_events(
+                            segments, mode=analysis_mode, frame_options=frame_options,
+                            source_windows=(analysis_mode == "frames"), stats=analysis_stats,
+                            profile_dir=profile_dir
+                        )
+                    release_intermediates(run_id)
+                    processed[path] = done
+                    path_events.setdefault(path, []).extend(events)
+                    path_errors[path] = path_errors.get(path, 0) + analysis_stats.get("errors", 0) - errors_before
+                    progressed = True
+                    
+                    local_timestamps = [event["timestamp"] for event in events]
+                    if local_timestamps:
+                        reel_path, appended = await run_blocking(executor, profiled_call, "highlights", profile_dir,
+                                                                 append_highlights, reel_path, path,
+                                                                 local_timestamps, options["buffer_seconds"])
+                        if reel_path:
+                            register_artifact(reel_path, run_id, kind='output')
+                        if appended:
+                            new_timestamps = [offsets[path] + t for t in local_timestamps]
+                            highlight_timestamps.extend(new_timestamps)
+                            logger.info(f"Live: {len(new_timestamps)} new highlights, {len(highlight_timestamps)} total")
+                            update_progress(3, f"{len(highlight_timestamps)} highlights so far", 50)
+                            if highlight_callback:
+                                highlight_callback(new_timestamps, list(highlight_timestamps), reel_path)
+                        else:
+                            # Keep the highlight list in step with what the reel contains
+                            logger.warning(f"Live: {len(local_timestamps)} highlights could not be added to the reel")
+                
+                if not complete:
+                    # Later chunks start after this one, whose duration is not final yet
+                    break
+                next_offset = offsets[path] + duration
+            
+            if finishing:
+                break
+            if progressed:
+                last_activity = time.time()
+            elif time.time() - last_activity >= options["idle_timeout"]:
+                # No new footage for a while: treat the recording as finished and flush the tail
+                logger.info("Live source idle; processing remaining footage and finishing")
+                finishing = True
+                continue
+            
+            await asyncio.sleep(options["poll_interval"])
+        
+        total_time = time.time() - start_time_total
+        if not ever_readable:
+            error = f"Live source never became readable: {source}"
+            logger.error(error)
+            update_progress(3, f"Error: {error}", 100)
+            return {
+                "original_video": source,
+                "segments": [],
+                "highlight_timestamps": [],
+                "highlights_video": None,
+                "success": False,
+                "error": error,
+                "processing_time": total_time
+            }
+        
+        # Each file (or chunk) is indexed under its own hash once its footage is final
+        for path, events in path_events.items():
+            await index_events(path, events, analysis_mode, partial=path_errors.get(path, 0) > 0)
+        
+        logger.info(f"Live highlight detection completed in {total_time:.2f}s: {len(highlight_timestamps)} highlights")
+        update_progress(3, "Process complete", 100)
+        
+        return {
+            "original_video": source,
+            "segments": [],
+            "highlight_timestamps": highlight_timestamps,
+            "highlights_video": reel_path,
+            "success": True,
+            "processing_time": total_time,
+            "analysis_mode": analysis_mode,
+            "analysis_stats": analysis_stats,
+            "profile_dir": profile_dir
+        }
+    
+    except Exception as e:
+        logger.error(f"Live process failed: {str(e)}")
+        update_progress(3, f"Error: {str(e)}", 100)
+        return {
+            "original_video": source,
+            "segments": [],
+            "highlight_timestamps": highlight_timestamps,
+            "highlights_video": reel_path,
+            "success": False,
+            "error": str(e)
+        }
+    
+    finally:
+        release_intermediates(run_id)
+        end_run(run_id)
+        enforce_quota()
+        if profile_dir:
+            try:
+                summarize_profiles(profile_dir)
+            except Exception as e:
+                logger.error(f"Failed to summarize profiles: {str(e)}")
+
+async def process_video(video_path, progress_callback=None, analysis_mode="video", frame_options=None,
+                        two_pass=False, live=False, live_options=None, highlight_callback=None, executor=None,
+                        output_format="mp4", output_dir=None, profile=None, variants=None):
     """
     Main controller function that orchestrates the entire process
     
     Args:
         video_path: Path to the video file
         progress_callback: Optional callback function to report progress (step, message, percent)
+        analysis_mode: "video" uploads encoded segments, "frames" sends sampled image batches
+        frame_options: Optional overrides for frame sampling (see analysis_agent.DEFAULT_FRAME_OPTIONS)
+        two_pass: Scan a cheap proxy first and re-analyze only windows around candidates
+        live: Follow a file that is still being recorded (or a directory of chunks)
+            and extend the reel as new highlights arrive (see process_live_video)
+        live_options: Optional overrides for LIVE_OPTIONS
+        highlight_callback: Optional callback for incremental highlights in live mode
+        executor: Optional executor for segment and highlight encoding; batch runs
+            pass one shared pool so encode work is bounded across matches
+        output_format: "mp4" writes one reel file; "hls" publishes each clip to an
+            HLS playlist as soon as it is encoded (see create_highlights_hls)
+        output_dir: Directory for HLS output (created in the output folder if omitted)
+        profile: Profile each stage with cProfile and tracemalloc, including work in
+            executor workers (defaults to the PROFILE_PIPELINE environment variable)
+        variants: Optional list of reel variants (see highlights_agent.DEFAULT_VARIANTS)
+            rendered together from one decode of each highlight window; replaces
+            the single reel and output_format
     """
-    logger.info(f"Starting football highlight detection for: {video_path}")
+    if live:
+        return await process_live_video(video_path, progress_callback, analysis_mode, frame_options,
+                                        live_options, highlight_callback, executor, profile)
+    
+    logger.info(f"Starting football highlight detection for: {video_path} (analysis mode: {analysis_mode}, two-pass: {two_pass})")
     start_time_total = time.time()
     
+    # Track every file this run writes so intermediates and old outputs get cleaned up
+    run_id = new_run_id()
+    begin_run(run_id, inputs=[video_path])
+    logger.info(f"Run id: {run_id}")
+    profile_dir = create_profile_dir(run_id) if profiling_enabled(profile) else None
+    
     # Helper function to update progress if callback exists
     def update_progress(step, message, percent):
         if progress_callback:
             progress_callback(step, message, percent)
-        logger.debug(f"Progress: Step {step}, {percent}%, {message}")
+        logger.debug("Progress: Step %s, %s%%, %s", step, percent, message)
     
     try:
         # Step 1: Segment the video
@@ -28,7 +433,12 @@ async def process_video(video_path, progress_callback=None):
         update_progress(1, "Segmenting video...", 5)
         segment_start = time.time()
         
-        segments = segment_video(video_path)
+        if two_pass:
+            # Both passes segment their own input during analysis
+            segments = plan_segments(video_path, COARSE_PASS["segment_length"])
+        else:
+            segments = await prepare_segments(video_path, run_id, analysis_mode, executor=executor,
+                                              profile_dir=profile_dir)
         
         if not segments:
             logger.error("Video segmentation failed or returned no segments")
@@ -53,10 +463,30 @@ async def process_video(video_path, progress_callback=None):
         
         # Periodically update progress during analysis
         total_segments = len(segments)
+        analysis_stats = {}
         
         # Create a wrapper to track analysis progress
         async def analyze_with_progress():
-            highlight_timestamps = await analyze_all_segments(segments)
+            if two_pass:
+                events, pass_stats = await analyze_coarse_to_fine(video_path, run_id, analysis_mode, frame_options, executor,
+                                                                 profile_dir)
+                analysis_stats.update(pass_stats)
+            else:
+                # Events stream in while segments are still being analyzed
+                found = []
+                def report_event(event):
+                    found.append(event)
+                    update_progress(2, f"Analyzing segments for highlights... {len(found)} found so far", 35)
+                
+                events = await analyze_all_segment_events(
+                    segments,
+                    mode=analysis_mode,
+                    frame_options=frame_options,
+                    source_windows=(analysis_mode == "frames"),
+                    stats=analysis_stats,
+                    on_event=report_event,
+                    profile_dir=profile_dir
+                )
             
             # Report progress throughout based on time estimation (simplified)
             for i in range(10):
@@ -66,24 +496,70 @@ async def process_video(video_path, progress_callback=None):
                     update_progress(2, f"Analyzing segments for highlights... {i*10}%", progress)
                 await asyncio.sleep(0.1)
                 
-            return highlight_timestamps
+            return events
             
-        highlight_timestamps = await analyze_with_progress()
+        with profile_stage("analyze", profile_dir, cpu=False):
+            highlight_events = await analyze_with_progress()
+        highlight_timestamps = [event["timestamp"] for event in highlight_events]
+        
+        # Results of a run with failed segments are stored as partial, so they never
+        # replace complete results stored earlier
+        analysis_errors = sum(pass_stats.get("errors", 0) for pass_stats in analysis_stats.values()) \
+            if two_pass else analysis_stats.get("errors", 0)
+        if analysis_errors:
+            logger.warning(f"{analysis_errors} segments failed analysis; indexing highlight events as partial")
+        await index_events(video_path, highlight_events, analysis_mode, partial=analysis_errors > 0)
+        
+        # Segments are only needed for analysis
+        release_intermediates(run_id)
         
         analysis_time = time.time() - analysis_start
         logger.info(f"Highlight analysis completed in {analysis_time:.2f}s: {len(highlight_timestamps)} highlights detected")
+        for pass_name, pass_stats in (analysis_stats.items() if two_pass else [("single", analysis_stats)]):
+            logger.info(f"Analysis ({pass_name} pass) sent {pass_stats.get('bytes_sent', 0) / (1024 * 1024):.2f} MB "
+                        f"in {pass_stats.get('requests', 0)} requests ({pass_stats.get('api_seconds', 0):.2f}s API time)")
         update_progress(2, f"Found {len(highlight_timestamps)} highlights", 66)
         
         # Step 3: Create highlights video
+        playlist_path = None
+        variant_outputs = None
+        if variants:
+            output_format = "variants"
+            output_dir = output_dir or create_output_dir(prefix="render")
+            register_artifact(output_dir, run_id, kind='output')
+        elif output_format == "hls":
+            output_dir = output_dir or create_output_dir()
+            register_artifact(output_dir, run_id, kind='output')
+        
         if highlight_timestamps:
             logger.info("Step 3: Creating highlights video...")
             update_progress(3, "Creating highlights video...", 70)
             highlight_start = time.time()
             
-            highlights_path = create_highlights(video_path, highlight_timestamps)
+            if variants:
+                variant_outputs = await run_blocking(executor, profiled_call, "highlights", profile_dir,
+                                                     render_variants, video_path, highlight_events, variants,
+                                                     output_dir=output_dir)
+                # The first reel variant (in the order requested) stands in as the main highlights video
+                highlights_path = main_variant_output(variants, variant_outputs)
+            elif output_format == "hls":
+                def report_clip(clip_index, total_clips, _):
+                    percent = 70 + int((clip_index + 1) / total_clips * 25)
+                    update_progress(3, f"Published highlight {clip_index + 1}/{total_clips} to playlist", percent)
+                
+                # Progress callbacks cannot cross into worker processes
+                playlist_path, highlights_path = await run_blocking(
+                    executor, profiled_call, "highlights", profile_dir,
+                    create_highlights_hls, video_path, highlight_timestamps, output_dir,
+                    clip_callback=report_clip if executor is None else None
+                )
+            else:
+                highlights_path = await run_blocking(executor, profiled_call, "highlights", profile_dir,
+                                                     create_highlights, video_path, highlight_timestamps)
             
             highlight_time = time.time() - highlight_start
             if highlights_path:
+                register_artifact(highlights_path if output_format == "mp4" else output_dir, run_id, kind='output')
                 logger.info(f"Highlights video created successfully in {highlight_time:.2f}s: {highlights_path}")
                 update_progress(3, "Highlights video created successfully", 95)
             else:
@@ -93,6 +569,9 @@ async def process_video(video_path, progress_callback=None):
             logger.warning("No highlights detected. Skipping highlight video creation.")
             update_progress(3, "No highlights detected", 95)
             highlights_path = None
+            if output_format == "hls":
+                # Close the playlist so waiting players stop polling
+                playlist_path, _ = create_highlights_hls(video_path, [], output_dir)
         
         # Log overall process statistics
         total_time = time.time() - start_time_total
@@ -105,9 +584,16 @@ async def process_video(video_path, progress_callback=None):
             "original_video": video_path,
             "segments": segments,
             "highlight_timestamps": highlight_timestamps,
+            "highlight_events": highlight_events,
             "highlights_video": highlights_path,
+            "highlights_playlist": playlist_path,
+            "variant_outputs": variant_outputs,
             "success": True,
-            "processing_time": total_time
+            "processing_time": total_time,
+            "analysis_mode": analysis_mode,
+            "two_pass": two_pass,
+            "profile_dir": profile_dir,
+            "analysis_stats": analysis_stats
         }
     
     except Exception as e:
@@ -121,4 +607,67 @@ async def process_video(video_path, progress_callback=None):
             "highlights_video": None,
             "success": False,
             "error": str(e)
-        } 
\ No newline at end of file
+        }
+    
+    finally:
+        release_intermediates(run_id)
+        end_run(run_id)
+        enforce_quota()
+        if profile_dir:
+            try:
+                summarize_profiles(profile_dir)
+            except Exception as e:
+                logger.error(f"Failed to summarize profiles: {str(e)}")
+
+async def rebuild_highlights(video_path, event_types=None, min_confidence=None, model_version=None, executor=None):
+    """
+    Build a highlights reel from events stored in the highlight index, without
+    running any analysis. Filters match highlight_index.query_events.
+    """
+    logger.info(f"Rebuilding highlights for {video_path} from the highlight index")
+    start_time_total = time.time()
+    
+    run_id = new_run_id()
+    begin_run(run_id, inputs=[video_path])
+    
+    try:
+        events = await run_blocking(None, match_events, video_path, event_types, min_confidence, model_version)
+        if not events:
+            logger.warning("No indexed events match; nothing to rebuild")
+            return {
+                "original_video": video_path,
+                "highlight_timestamps": [],
+                "highlights_video": None,
+                "success": False,
+                "error": "No indexed events for this video"
+            }
+        
+        highlight_timestamps = sorted(event["timestamp"] for event in events)
+        highlights_path = await run_blocking(executor, create_highlights, video_path, highlight_timestamps)
+        if highlights_path:
+            register_artifact(highlights_path, run_id, kind='output')
+        
+        total_time = time.time() - start_time_total
+        logger.info(f"Rebuilt highlights from {len(events)} indexed events in {total_time:.2f}s")
+        return {
+            "original_video": video_path,
+            "highlight_timestamps": highlight_timestamps,
+            "highlight_events": events,
+            "highlights_video": highlights_path,
+            "success": highlights_path is not None,
+            "processing_time": total_time
+        }
+    
+    except Exception as e:
+        logger.error(f"Rebuild failed: {str(e)}")
+        return {
+            "original_video": video_path,
+            "highlight_timestamps": [],
+            "highlights_video": None,
+            "success": False,
+            "error": str(e)
+        }
+    
+    finally:
+        end_run(run_id)
+        enforce_quota()
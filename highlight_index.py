@@ -0,0 +1,215 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from utils import FOLDERS, logger
+
+# Lives next to (not inside) the artifact folders so quota eviction never touches it
+INDEX_PATH = os.environ.get(
+    'HIGHLIGHT_INDEX_PATH',
+    os.path.join(os.path.dirname(FOLDERS['output']), 'highlights.db')
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    file_hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_matches_path ON matches (path, size, mtime_ns);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    file_hash TEXT NOT NULL REFERENCES matches (file_hash),
+    timestamp REAL NOT NULL,
+    event_type TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    model_version TEXT NOT NULL,
+    analysis_mode TEXT,
+    partial INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_type_confidence ON events (event_type, confidence);
+CREATE INDEX IF NOT EXISTS idx_events_match_time ON events (file_hash, timestamp);
+"""
+
+# Columns added after the first release: (table, column, definition)
+MIGRATIONS = [
+    ("events", "partial", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def migrate(conn):
+    """Add columns missing from an index created by an older version"""
+    for table, column, definition in MIGRATIONS:
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+@contextmanager
+def connect(index_path=None):
+    """Open the index (creating the schema on first use) and commit on success"""
+    index_path = index_path or INDEX_PATH
+    conn = sqlite3.connect(index_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        with _schema_lock:
+            if index_path not in _schema_ready:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                migrate(conn)
+                _schema_ready.add(index_path)
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+def normalize_event_type(event_type):
+    """Event types are stored lower-case so "Goal" and "goal" match"""
+    return str(event_type or "unknown").strip().lower()
+
+def file_hash(video_path, conn=None):
+    """
+    SHA-256 of the file contents. A file already indexed with the same path,
+    size and mtime is not hashed again.
+    """
+    stat = os.stat(video_path)
+    path = os.path.abspath(video_path)
+
+    def lookup(c):
+        row = c.execute(
+            "SELECT file_hash FROM matches WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns)
+        ).fetchone()
+        return row["file_hash"] if row else None
+
+    if conn is not None:
+        cached = lookup(conn)
+    else:
+        with connect() as c:
+            cached = lookup(c)
+    if cached:
+        return cached
+
+    start_time = time.time()
+    digest = hashlib.sha256()
+    with open(video_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    logger.info(f"Hashed {video_path} in {time.time() - start_time:.2f}s")
+    return digest.hexdigest()
+
+def record_events(video_path, events, model_version, analysis_mode=None, index_path=None, partial=False):
+    """
+    Store the analyzed events of a match. A complete run replaces earlier results
+    of the same model version for that match. A partial run (some segments failed)
+    is stored with partial=1 and only replaces earlier partial results; it is
+    skipped when complete results already exist. Returns the match file hash.
+    """
+    stat = os.stat(video_path)
+    now = time.time()
+    with connect(index_path) as conn:
+        match_hash = file_hash(video_path, conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO matches (file_hash, path, size, mtime_ns, indexed_at) VALUES (?, ?, ?, ?, ?)",
+            (match_hash, os.path.abspath(video_path), stat.st_size, stat.st_mtime_ns, now)
+        )
+        if partial:
+            complete = conn.execute(
+                "SELECT 1 FROM events WHERE file_hash = ? AND model_version = ? AND partial = 0 LIMIT 1",
+                (match_hash, model_version)
+            ).fetchone()
+            if complete:
+                logger.info(f"Not indexing partial results for {video_path}: complete results are already stored")
+                return match_hash
+            conn.execute("DELETE FROM events WHERE file_hash = ? AND model_version = ? AND partial = 1",
+                         (match_hash, model_version))
+        else:
+            conn.execute("DELETE FROM events WHERE file_hash = ? AND model_version = ?", (match_hash, model_version))
+
+        rows = []
+        for event in events:
+            try:
+                confidence = float(event.get("confidence") or 0)
+            except (TypeError, ValueError):
+                confidence = 0.0
+            rows.append((match_hash, float(event["timestamp"]), normalize_event_type(event.get("event_type")),
+                         confidence, model_version, analysis_mode, int(partial), now))
+        conn.executemany(
+            "INSERT INTO events (file_hash, timestamp, event_type, confidence, model_version, analysis_mode, partial, "
+            "created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    kind = "partial " if partial else ""
+    logger.info(f"Indexed {len(rows)} {kind}events for {video_path} ({match_hash[:12]}, model {model_version})")
+    return match_hash
+
+def query_events(event_types=None, min_confidence=None, file_hashes=None, model_version=None,
+                 start=None, end=None, index_path=None):
+    """
+    Return stored events as dicts, ordered by match and timestamp.
+    All filters are optional; event_types and file_hashes are lists.
+    Events from partial runs are included with partial=1.
+    """
+    clauses, params = [], []
+    if event_types:
+        clauses.append(f"event_type IN ({','.join('?' * len(event_types))})")
+        params.extend(normalize_event_type(event_type) for event_type in event_types)
+    if min_confidence is not None:
+        clauses.append("confidence >= ?")
+        params.append(min_confidence)
+    if file_hashes:
+        clauses.append(f"file_hash IN ({','.join('?' * len(file_hashes))})")
+        params.extend(file_hashes)
+    if model_version:
+        clauses.append("model_version = ?")
+        params.append(model_version)
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("timestamp <= ?")
+        params.append(end)
+
+    sql = "SELECT file_hash, timestamp, event_type, confidence, model_version, analysis_mode, partial FROM events"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY file_hash, timestamp"
+
+    with connect(index_path) as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+def match_events(video_path, event_types=None, min_confidence=None, model_version=None, index_path=None):
+    """Return the stored events of one match (empty if it was never indexed)"""
+    with connect(index_path) as conn:
+        match_hash = file_hash(video_path, conn)
+    return query_events(event_types, min_confidence, [match_hash], model_version, index_path=index_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Query indexed highlight events across matches")
+    parser.add_argument("videos", nargs="*", help="Restrict to these match files")
+    parser.add_argument("--event-type", action="append", help="Event type to include (repeatable)")
+    parser.add_argument("--min-confidence", type=float)
+    parser.add_argument("--model-version")
+    args = parser.parse_args()
+
+    file_hashes = [file_hash(video) for video in args.videos] or None
+    start_time = time.time()
+    events = query_events(args.event_type, args.min_confidence, file_hashes, args.model_version)
+    elapsed_ms = (time.time() - start_time) * 1000
+
+    for event in events:
+        print(f"{event['file_hash'][:12]}  {event['timestamp']:9.2f}s  {event['event_type']:<16} "
+              f"{event['confidence']:.2f}  {event['model_version']}{'  (partial)' if event['partial'] else ''}")
+    print(f"{len(events)} events in {elapsed_ms:.1f} ms")
+
+if __name__ == "__main__":
+    main()
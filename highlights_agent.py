@@ -1,13 +1,27 @@
 from moviepy.editor import VideoFileClip, concatenate_videoclips
-from utils import create_temp_file, logger
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from PIL import Image
+import numpy as np
+from utils import create_temp_file, create_output_dir, logger, probe_video, validation_enabled
+import math
+import re
+import subprocess
 import time
 import os
+import wave
 
-def create_highlights(video_path, timestamps, buffer_seconds=5):
+def create_highlights(video_path, timestamps, buffer_seconds=5, validate=None):
     """
     Create a highlights video from the original video and a list of timestamps
     Each highlight will include {buffer_seconds} before and after the timestamp
+    
+    validate: check the written output kept its audio track (defaults to
+    off in trusted fast mode, see utils.validation_enabled)
     """
+    if validate is None:
+        validate = validation_enabled()
+    
     logger.info(f"Creating highlights video from {video_path}")
     logger.info(f"Number of highlight timestamps: {len(timestamps)}")
     logger.info(f"Buffer around each highlight: {buffer_seconds} seconds")
@@ -44,10 +58,10 @@ def create_highlights(video_path, timestamps, buffer_seconds=5):
                 # Extract the subclip
                 highlight_clip = original_clip.subclip(start_time_clip, end_time_clip)
                 clip_has_audio = highlight_clip.audio is not None
-                logger.debug(f"Highlight clip #{i+1} has audio: {clip_has_audio}")
+                logger.debug("Highlight clip #%s has audio: %s", i+1, clip_has_audio)
                 
                 highlight_clips.append(highlight_clip)
-                logger.debug(f"Highlight #{i+1} extracted successfully in {time.time() - clip_start:.2f}s")
+                logger.debug("Highlight #%s extracted successfully in %.2fs", i+1, time.time() - clip_start)
             except Exception as e:
                 logger.error(f"Failed to extract highlight #{i+1}: {str(e)}")
                 # Continue with other highlights
@@ -85,13 +99,11 @@ def create_highlights(video_path, timestamps, buffer_seconds=5):
                 logger.info(f"Highlights video created: {file_size_mb:.2f} MB")
                 
                 # Validate the final video has audio if the original did
-                if has_audio:
-                    validation_clip = VideoFileClip(output_path)
-                    output_has_audio = validation_clip.audio is not None
+                if has_audio and validate:
+                    output_has_audio = probe_video(output_path)["has_audio"]
                     logger.info(f"Final output has audio: {output_has_audio}")
-                    if not output_has_audio and has_audio:
+                    if not output_has_audio:
                         logger.warning("Audio was lost during highlight creation!")
-                    validation_clip.close()
                 
                 final_clip.close()
                 logger.info(f"Highlights compilation completed in {time.time() - concat_start:.2f}s")
@@ -118,4 +130,401 @@ def create_highlights(video_path, timestamps, buffer_seconds=5):
                 original_clip.close()
             except:
                 pass
-        return None 
\ No newline at end of file
+        return None
+
+def concat_videos(paths, output_path, from_ts=False):
+    """
+    Concatenate videos with identical encoding settings without re-encoding
+    (ffmpeg concat demuxer with stream copy)
+    from_ts: inputs are MPEG-TS, so AAC audio needs converting for an MP4 container
+    """
+    list_path = create_temp_file(suffix=".txt")
+    try:
+        with open(list_path, "w") as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        
+        cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", list_path,
+               "-c", "copy"] + (["-bsf:a", "aac_adtstoasc"] if from_ts else []) + [
+               "-movflags", "+faststart", output_path]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+    return output_path
+
+def append_highlights(reel_path, video_path, timestamps, buffer_seconds=5):
+    """
+    Extend an existing highlights reel with clips around new timestamps.
+    Only the new clips are rendered; they are appended to the reel by stream copy.
+    Returns (reel_path, appended): the reel path (a new file if reel_path is None)
+    and whether the new clips made it into the reel. On failure the reel is unchanged.
+    """
+    logger.info(f"Appending {len(timestamps)} highlights from {video_path} to reel {reel_path}")
+    
+    part_path = create_highlights(video_path, timestamps, buffer_seconds)
+    if not part_path:
+        logger.warning("No new highlight clips rendered; reel unchanged")
+        return reel_path, False
+    if not reel_path or not os.path.exists(reel_path):
+        return part_path, True
+    
+    append_start = time.time()
+    combined_path = create_temp_file(folder_type='output')
+    appended = False
+    try:
+        concat_videos([reel_path, part_path], combined_path)
+        os.replace(combined_path, reel_path)
+        appended = True
+        logger.info(f"Reel extended in {time.time() - append_start:.2f}s: {reel_path}")
+    except Exception as e:
+        logger.error(f"Failed to append highlights to reel: {str(e)}")
+        if os.path.exists(combined_path):
+            os.remove(combined_path)
+    finally:
+        os.remove(part_path)
+    
+    return reel_path, appended
+
+def write_hls_playlist(playlist_path, clips, target_duration, finished=False):
+    """
+    Write an EVENT playlist listing the finished clips [(filename, duration)].
+    Written to a temp file and renamed so players never read a partial playlist.
+    """
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+        f"#EXT-X-TARGETDURATION:{target_duration}",
+        "#EXT-X-MEDIA-SEQUENCE:0"
+    ]
+    for i, (filename, duration) in enumerate(clips):
+        if i > 0:
+            # Every clip is encoded on its own, so timestamps restart
+            lines.append("#EXT-X-DISCONTINUITY")
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(filename)
+    if finished:
+        lines.append("#EXT-X-ENDLIST")
+    
+    temp_path = f"{playlist_path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, playlist_path)
+
+def create_highlights_hls(video_path, timestamps, output_dir, buffer_seconds=5, clip_callback=None):
+    """
+    Create the highlights reel incrementally as an HLS playlist.
+    Each highlight is encoded as its own MPEG-TS segment and appended to
+    output_dir/playlist.m3u8 as soon as it is written, so playback can start
+    after the first clip. When all clips are done the segments are joined by
+    stream copy into output_dir/highlights.mp4 for download.
+    
+    clip_callback: optional callback (clip_index, total_clips, playlist_path)
+    Returns (playlist_path, mp4_path); mp4_path is None if no clip was written.
+    """
+    logger.info(f"Creating HLS highlights from {video_path} into {output_dir}")
+    logger.info(f"Number of highlight timestamps: {len(timestamps)}")
+    
+    playlist_path = os.path.join(output_dir, "playlist.m3u8")
+    target_duration = math.ceil(2 * buffer_seconds) + 1
+    clips = []
+    write_hls_playlist(playlist_path, clips, target_duration)
+    
+    if not timestamps:
+        write_hls_playlist(playlist_path, clips, target_duration, finished=True)
+        logger.warning("No highlights to process. Returning empty playlist.")
+        return playlist_path, None
+    
+    start_time = time.time()
+    original_clip = VideoFileClip(video_path, audio=True)
+    try:
+        for i, timestamp in enumerate(timestamps):
+            clip_start = time.time()
+            start_time_clip = max(0, timestamp - buffer_seconds)
+            end_time_clip = min(original_clip.duration, timestamp + buffer_seconds)
+            filename = f"clip_{i:04d}.ts"
+            clip_path = os.path.join(output_dir, filename)
+            
+            try:
+                highlight_clip = original_clip.subclip(start_time_clip, end_time_clip)
+                highlight_clip.write_videofile(
+                    clip_path,
+                    codec='libx264',
+                    audio_codec='aac',
+                    temp_audiofile=f"{clip_path}.temp-audio.m4a",
+                    remove_temp=True,
+                    logger=None
+                )
+            except Exception as e:
+                logger.error(f"Failed to write highlight #{i+1}: {str(e)}")
+                continue
+            
+            clips.append((filename, end_time_clip - start_time_clip))
+            write_hls_playlist(playlist_path, clips, target_duration)
+            logger.info(f"Highlight #{i+1} published to playlist in {time.time() - clip_start:.2f}s")
+            if clip_callback:
+                clip_callback(i, len(timestamps), playlist_path)
+    finally:
+        original_clip.close()
+    
+    write_hls_playlist(playlist_path, clips, target_duration, finished=True)
+    
+    mp4_path = None
+    if clips:
+        try:
+            mp4_path = concat_videos([os.path.join(output_dir, filename) for filename, _ in clips],
+                                     os.path.join(output_dir, "highlights.mp4"), from_ts=True)
+        except Exception as e:
+            logger.error(f"Failed to join HLS segments into MP4: {str(e)}")
+    
+    logger.info(f"HLS highlight creation completed in {time.time() - start_time:.2f}s: {len(clips)} clips")
+    return playlist_path, mp4_path
+
+# Reel variants rendered from one decode of the source
+#   max_duration: keep the most confident highlights that fit, in match order
+#   height: output height (None keeps the source resolution)
+#   per_event: write every highlight to its own file instead of one reel
+DEFAULT_VARIANTS = [
+    {"name": "full"},
+    {"name": "social", "max_duration": 60, "height": 720},
+    {"name": "events", "per_event": True}
+]
+
+AUDIO_FPS = 44100
+
+def _output_size(source_size, height):
+    """Output (width, height) for a target height, keeping aspect ratio and even dimensions"""
+    width, source_height = source_size
+    if not height or height >= source_height:
+        return (width - width % 2, source_height - source_height % 2)
+    scaled_width = int(round(width * height / source_height))
+    return (scaled_width - scaled_width % 2, height - height % 2)
+
+def _select_windows(windows, variant):
+    """Indices of the windows a reel variant uses, in match order"""
+    indices = list(range(len(windows)))
+    max_duration = variant.get("max_duration")
+    if not max_duration:
+        return indices
+    
+    chosen, total = [], 0
+    for i in sorted(indices, key=lambda i: windows[i]["confidence"], reverse=True):
+        length = windows[i]["end"] - windows[i]["start"]
+        if total + length <= max_duration:
+            chosen.append(i)
+            total += length
+    return sorted(chosen)
+
+def main_variant_output(variants, outputs):
+    """Path of the first reel (non per-event) variant that was rendered, or None"""
+    for variant in variants or DEFAULT_VARIANTS:
+        path = outputs.get(variant["name"])
+        if not variant.get("per_event") and isinstance(path, str):
+            return path
+    return None
+
+def _match_audio_length(pcm, frame_count, fps):
+    """
+    Pad with silence or trim a window's PCM to exactly frame_count / fps seconds.
+    Windows are appended to shared reel encoders, so any per-window mismatch
+    between frames and samples would accumulate as A/V drift along the reel.
+    """
+    samples = int(round(frame_count * AUDIO_FPS / fps))
+    if len(pcm) >= samples:
+        return pcm[:samples]
+    padding = np.zeros((samples - len(pcm), pcm.shape[1]), dtype=pcm.dtype)
+    return np.concatenate([pcm, padding])
+
+def _open_output(output_path, size, fps, has_audio):
+    """Start a video-only encoder plus a WAV file for one output"""
+    video_path = f"{output_path}.video.mp4"
+    target = {
+        "output": output_path,
+        "video_path": video_path,
+        "size": size,
+        "writer": FFMPEG_VideoWriter(video_path, size, fps, codec='libx264'),
+        "wav_path": None,
+        "wav": None
+    }
+    if has_audio:
+        try:
+            target["wav_path"] = f"{output_path}.audio.wav"
+            target["wav"] = wave.open(target["wav_path"], "wb")
+            target["wav"].setnchannels(2)
+            target["wav"].setsampwidth(2)
+            target["wav"].setframerate(AUDIO_FPS)
+        except Exception:
+            _abort_output(target)
+            raise
+    return target
+
+def _abort_output(target):
+    """Stop an output after a failure: close its encoder and remove every file it wrote"""
+    for close in (target["writer"].close, target["wav"].close if target["wav"] else None):
+        if close is None:
+            continue
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"Failed to close output {target['output']}: {str(e)}")
+    for path in (target["video_path"], target["wav_path"], target["output"]):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def _close_output(target):
+    """Finish encoding and mux audio into the final output; returns its path or None"""
+    try:
+        target["writer"].close()
+        if target["wav"] is None:
+            os.replace(target["video_path"], target["output"])
+            return target["output"]
+        
+        target["wav"].close()
+        cmd = [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+               "-i", target["video_path"], "-i", target["wav_path"],
+               "-c:v", "copy", "-c:a", "aac", "-shortest", "-movflags", "+faststart", target["output"]]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return target["output"]
+    except Exception as e:
+        logger.error(f"Failed to finish output {target['output']}: {str(e)}")
+        if os.path.exists(target["output"]):
+            os.remove(target["output"])
+        return None
+    finally:
+        if target["wav"] is not None:
+            target["wav"].close()
+        for path in (target["video_path"], target["wav_path"]):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+def render_variants(video_path, events, variants=None, buffer_seconds=5, output_dir=None):
+    """
+    Render several highlight variants from a single decode of each source window.
+    Each window around a highlight is decoded once; its frames are resized once
+    per distinct output size and fanned out to every encoder that needs them.
+    
+    events: event dicts (timestamp, event_type, confidence) or plain timestamps
+    variants: list of variant dicts (see DEFAULT_VARIANTS); names must be unique
+    Returns {variant name: output path} with a list of paths for per-event variants.
+    """
+    variants = variants or DEFAULT_VARIANTS
+    events = [event if isinstance(event, dict) else {"timestamp": event} for event in events]
+    logger.info(f"Rendering {len(variants)} variants from {video_path} ({len(events)} highlights)")
+    
+    if not events:
+        logger.warning("No highlights to render. Returning no outputs.")
+        return {}
+    
+    start_time = time.time()
+    output_dir = output_dir or create_output_dir(prefix="render")
+    original_clip = VideoFileClip(video_path, audio=True)
+    has_audio = original_clip.audio is not None
+    fps = original_clip.fps
+    
+    windows = []
+    for event in sorted(events, key=lambda event: event["timestamp"]):
+        try:
+            confidence = float(event.get("confidence") or 0)
+        except (TypeError, ValueError):
+            confidence = 0.0
+        windows.append({
+            "start": max(0, event["timestamp"] - buffer_seconds),
+            "end": min(original_clip.duration, event["timestamp"] + buffer_seconds),
+            "event_type": str(event.get("event_type") or "highlight"),
+            "confidence": confidence
+        })
+    
+    # Which variants consume each window
+    consumers = {i: [] for i in range(len(windows))}
+    reel_outputs = {}
+    outputs = {}
+    for variant in variants:
+        size = _output_size(original_clip.size, variant.get("height"))
+        if variant.get("per_event"):
+            outputs[variant["name"]] = []
+            for i in _select_windows(windows, variant):
+                consumers[i].append((variant, size))
+        else:
+            selected = _select_windows(windows, variant)
+            if not selected:
+                logger.warning(f"Variant '{variant['name']}' selects no highlights; skipping")
+                outputs[variant["name"]] = None
+                continue
+            outputs[variant["name"]] = None
+            reel_outputs[variant["name"]] = (os.path.join(output_dir, f"{variant['name']}.mp4"), size)
+            for i in selected:
+                consumers[i].append((variant, size))
+    
+    # Every opened output is either closed normally or aborted, so no encoder
+    # process or temporary file outlives a failure
+    reel_targets = {}
+    try:
+        for name, (output_path, size) in reel_outputs.items():
+            reel_targets[name] = _open_output(output_path, size, fps, has_audio)
+        
+        for i, window in enumerate(windows):
+            if not consumers[i]:
+                continue
+            window_start = time.time()
+            
+            # Per-event outputs only live for the duration of their window
+            targets = []
+            event_targets = []
+            try:
+                for variant, size in consumers[i]:
+                    if variant.get("per_event"):
+                        slug = re.sub(r'[^a-z0-9]+', '_', window["event_type"].lower()).strip('_')
+                        output_path = os.path.join(output_dir, f"{variant['name']}_{i+1:03d}_{slug}.mp4")
+                        target = _open_output(output_path, size, fps, has_audio)
+                        event_targets.append((variant, target))
+                    else:
+                        target = reel_targets[variant["name"]]
+                    targets.append(target)
+                
+                subclip = original_clip.subclip(window["start"], window["end"])
+                frame_count = 0
+                for frame in subclip.iter_frames(fps=fps, dtype="uint8"):
+                    frame_count += 1
+                    resized = {}
+                    for target in targets:
+                        size = target["size"]
+                        if size not in resized:
+                            if (frame.shape[1], frame.shape[0]) == size:
+                                resized[size] = frame
+                            else:
+                                resized[size] = np.asarray(Image.fromarray(frame).resize(size, Image.BILINEAR))
+                        target["writer"].write_frame(resized[size])
+                
+                if has_audio:
+                    samples = subclip.audio.to_soundarray(fps=AUDIO_FPS, nbytes=2, quantize=True)
+                    pcm = np.ascontiguousarray(samples, dtype=np.int16)
+                    if pcm.ndim == 1 or pcm.shape[1] == 1:
+                        pcm = np.repeat(pcm.reshape(-1, 1), 2, axis=1)
+                    pcm = _match_audio_length(pcm, frame_count, fps)
+                    for target in targets:
+                        target["wav"].writeframes(pcm.tobytes())
+                
+                while event_targets:
+                    variant, target = event_targets.pop(0)
+                    path = _close_output(target)
+                    if path:
+                        outputs[variant["name"]].append(path)
+            finally:
+                for _, target in event_targets:
+                    _abort_output(target)
+            
+            logger.info(f"Window {i+1}/{len(windows)} ({window['start']:.2f}-{window['end']:.2f}s) decoded once "
+                        f"for {len(targets)} outputs in {time.time() - window_start:.2f}s")
+        
+        for name in list(reel_targets):
+            outputs[name] = _close_output(reel_targets.pop(name))
+    finally:
+        for target in reel_targets.values():
+            _abort_output(target)
+        original_clip.close()
+    
+    logger.info(f"Rendered {len(variants)} variants in {time.time() - start_time:.2f}s into {output_dir}")
+    return outputs
@@ -0,0 +1,131 @@
+import json
+import re
+from utils import logger
+
+# Trailing commas are the most common defect in model-written JSON
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+def _loads_lenient(text):
+    """json.loads, retrying once with trailing commas removed"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(r'\1', text))
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for a JSON array of objects arriving in text chunks.
+
+    Text before the array (prose, markdown fences) is ignored, including
+    bracketed asides such as "[seconds]" that close before any object. Each
+    top-level object is returned from feed() as soon as its closing brace
+    arrives, and only the object currently being read is kept in memory.
+    A malformed element is skipped without losing the elements around it.
+    """
+
+    def __init__(self):
+        self.found_array = False   # an array of objects (or an empty array) has been seen
+        self.finished = False      # the closing ']' has been seen
+        self.parsed = 0
+        self.malformed = 0
+        self._in_array = False     # inside a '[' that may be the array
+        self._prose = False        # non-JSON text seen inside that '['
+        self._buffer = []          # characters of the current element
+        self._depth = 0            # nesting depth inside the current element
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        """Consume a chunk of text; returns the list of objects completed by it"""
+        completed = []
+        for char in text:
+            if self.finished:
+                break
+
+            if not self._in_array:
+                if char == '[':
+                    self._in_array = True
+                    self._prose = False
+                continue
+
+            if self._depth == 0:
+                # Between elements of the top-level array
+                if char == '{':
+                    self.found_array = True
+                    self._buffer = [char]
+                    self._depth = 1
+                elif char == ']':
+                    if self.found_array or not self._prose:
+                        self.found_array = True
+                        self.finished = True
+                    else:
+                        # Brackets in prose before the array; keep looking for it
+                        self._in_array = False
+                elif not char.isspace() and char != ',':
+                    self._prose = True
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._complete(''.join(self._buffer)))
+                    self._buffer = []
+                    if char == ']':
+                        # A broken element swallowed the array's closing bracket
+                        self.finished = True
+        return completed
+
+    def close(self):
+        """Signal end of stream; returns any object that can still be recovered"""
+        recovered = []
+        if self._depth > 0 and self._buffer:
+            # Truncated response: try closing the dangling element
+            text = ''.join(self._buffer) + ('"' if self._in_string else '') + '}' * self._depth
+            recovered = self._complete(text)
+        self._buffer = []
+        self._depth = 0
+        return recovered
+
+    def _complete(self, text):
+        """Parse one element; on failure salvage objects swallowed by a broken one"""
+        try:
+            item = _loads_lenient(text)
+            self.parsed += 1
+            return [item] if isinstance(item, dict) else []
+        except json.JSONDecodeError:
+            pass
+
+        # An element missing its closing brace absorbs the ones after it, e.g.
+        # {"a": 1, {"b": 2}, {"c": 3}. Recover every complete object inside.
+        decoder = json.JSONDecoder()
+        recovered = []
+        position = 1
+        while True:
+            start = text.find('{', position)
+            if start < 0:
+                break
+            try:
+                item, position = decoder.raw_decode(text, start)
+            except json.JSONDecodeError:
+                position = start + 1
+                continue
+            if isinstance(item, dict):
+                recovered.append(item)
+
+        self.malformed += 1
+        self.parsed += len(recovered)
+        logger.warning(f"Skipped malformed JSON element in response ({len(recovered)} nested elements recovered)")
+        logger.debug("Malformed JSON element: %s", text)
+        return recovered
@@ -0,0 +1,153 @@
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+from utils import FOLDERS, logger
+from artifact_store import touch_artifact
+
+# Outputs and uploads can be streamed from disk by a small HTTP server next to the
+# Streamlit app, so videos are never loaded into Streamlit's in-memory media store.
+# Opt-in: the server only runs when MEDIA_BASE_URL says how browsers reach it
+# (a default such as localhost would point remote viewers at their own machine).
+MEDIA_BASE_URL = (os.environ.get('MEDIA_BASE_URL') or '').rstrip('/') or None
+MEDIA_SERVER_HOST = os.environ.get('MEDIA_SERVER_HOST', '127.0.0.1')
+MEDIA_SERVER_PORT = int(os.environ.get('MEDIA_SERVER_PORT', '8502'))
+# Origin allowed to fetch media from scripts (e.g. an HLS player on the app page)
+MEDIA_ALLOW_ORIGIN = os.environ.get('MEDIA_ALLOW_ORIGIN')
+
+# Only these folders are served: /<kind>/<relative path>
+SERVED_KINDS = ('output', 'uploads')
+
+CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.mov': 'video/quicktime',
+    '.avi': 'video/x-msvideo',
+    '.ts': 'video/mp2t',
+    '.m3u8': 'application/vnd.apple.mpegurl'
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+_server = None
+_server_lock = threading.Lock()
+
+def resolve_media_path(url_path):
+    """Map a request path to a file inside a served folder, or None"""
+    parts = unquote(urlsplit(url_path).path).lstrip('/').split('/', 1)
+    if len(parts) != 2 or parts[0] not in SERVED_KINDS:
+        return None
+
+    root = os.path.realpath(FOLDERS[parts[0]])
+    path = os.path.realpath(os.path.join(root, parts[1]))
+    if os.path.commonpath([path, root]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """Serves files with their video content type and byte-range support for seeking"""
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        path = resolve_media_path(self.path)
+        if path is None:
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range')
+        match = _RANGE.match(range_header or '')
+        if range_header and match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), size - 1)
+            else:
+                # Suffix range: the last N bytes
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+
+        extension = os.path.splitext(path)[1].lower()
+        self.send_header('Content-Type', CONTENT_TYPES.get(extension, 'application/octet-stream'))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if MEDIA_ALLOW_ORIGIN:
+            self.send_header('Access-Control-Allow-Origin', MEDIA_ALLOW_ORIGIN)
+        if extension == '.m3u8':
+            # Playlists grow while clips are rendering
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        if not send_body:
+            return
+        # Files being watched or downloaded are the last to be evicted
+        touch_artifact(path)
+        try:
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # Players routinely drop connections when seeking
+            pass
+
+    def log_message(self, format, *args):
+        logger.debug("Media server: " + format, *args)
+
+def start_media_server():
+    """
+    Start the media server in a daemon thread (once per process).
+    Returns the server, or None when MEDIA_BASE_URL is not configured.
+    """
+    global _server
+    if MEDIA_BASE_URL is None:
+        return None
+    with _server_lock:
+        if _server is None:
+            server = ThreadingHTTPServer((MEDIA_SERVER_HOST, MEDIA_SERVER_PORT), MediaRequestHandler)
+            server.daemon_threads = True
+            thread = threading.Thread(target=server.serve_forever, name="media-server", daemon=True)
+            thread.start()
+            _server = server
+            logger.info(f"Media server listening on {MEDIA_SERVER_HOST}:{MEDIA_SERVER_PORT} ({MEDIA_BASE_URL})")
+    return _server
+
+def media_server_running():
+    """True when media URLs can be handed to browsers"""
+    return _server is not None
+
+def media_url(path):
+    """
+    Public URL of a file inside a served folder.
+    Raises ValueError when the server is not running or the file is not served.
+    """
+    if not media_server_running():
+        raise ValueError("Media server is not running")
+    real_path = os.path.realpath(path)
+    for kind in SERVED_KINDS:
+        root = os.path.realpath(FOLDERS[kind])
+        if os.path.commonpath([real_path, root]) == root:
+            relative = os.path.relpath(real_path, root).replace(os.sep, '/')
+            return f"{MEDIA_BASE_URL}/{kind}/{quote(relative)}"
+    raise ValueError(f"{path} is not inside a served folder")
@@ -0,0 +1,180 @@
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from utils import logger, LOG_DIR
+
+# Profiling is opt-in: PROFILE_PIPELINE=true or process_video(profile=True)
+PROFILE_ROOT = os.path.join(LOG_DIR, 'profiles')
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 10
+TRACEMALLOC_FRAMES = 5
+
+def profiling_enabled(profile=None):
+    """Explicit parameter wins; otherwise read the PROFILE_PIPELINE environment variable"""
+    if profile is not None:
+        return bool(profile)
+    return os.environ.get('PROFILE_PIPELINE', '').lower() in ('1', 'true')
+
+def create_profile_dir(run_id):
+    """Create the directory that holds every profile file of a run"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    profile_dir = os.path.join(PROFILE_ROOT, f"{timestamp}_{run_id}")
+    os.makedirs(profile_dir, exist_ok=True)
+    logger.info(f"Profiling enabled, writing profiles to {profile_dir}")
+    return profile_dir
+
+# tracemalloc is process-global: started by the first open stage, stopped by the last
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_started_tracing = False
+
+# One cProfile profiler per thread (nested stages in a thread are not profiled again)
+_profiler_state = threading.local()
+
+def _acquire_tracing():
+    """Start tracemalloc if needed; returns True when no other stage is open"""
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _started_tracing = True
+        _tracing_users += 1
+        return _tracing_users == 1
+
+def _release_tracing():
+    """Stop tracemalloc once the last open stage that needed it has finished"""
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+def _acquire_profiler():
+    """Return an enabled cProfile profiler, or None if one is already running here"""
+    if getattr(_profiler_state, "active", False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler owns the hook (e.g. a debugger, or another thread on
+        # Python 3.12+, where profiling is process-wide)
+        return None
+    _profiler_state.active = True
+    return profiler
+
+def _release_profiler(profiler):
+    profiler.disable()
+    _profiler_state.active = False
+
+@contextmanager
+def profile_stage(stage, profile_dir, cpu=True):
+    """
+    Profile the enclosed block with cProfile and track its memory peak with tracemalloc.
+    Writes {stage}-{id}.prof and {stage}-{id}.json into profile_dir.
+    Does nothing when profile_dir is None.
+
+    cpu=False records wall time and memory only. Use it for async stages: cProfile
+    follows the thread, so across an await it would also count other coroutines
+    (e.g. other matches in a batch) sharing the event loop; profile the blocking
+    work of such stages with profiled_call where it runs instead. cProfile is also
+    skipped when a stage is already being profiled in the same thread.
+    The memory peak is exact only when no other stage overlaps; overlapping
+    stages share tracemalloc and are marked "overlapping" in the metadata.
+    """
+    if profile_dir is None:
+        yield
+        return
+
+    exclusive = _acquire_tracing()
+    if exclusive:
+        tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    profiler = _acquire_profiler() if cpu else None
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            _release_profiler(profiler)
+        wall_time = time.time() - start_time
+
+        # pid keeps files from worker processes apart
+        base = os.path.join(profile_dir, f"{stage}-{os.getpid()}-{uuid.uuid4().hex[:6]}")
+        try:
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            snapshot = tracemalloc.take_snapshot()
+            if profiler is not None:
+                profiler.dump_stats(f"{base}.prof")
+            allocations = [
+                {"site": str(stat.traceback[0]), "size": stat.size, "count": stat.count}
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            ]
+            with open(f"{base}.json", "w") as f:
+                json.dump({"stage": stage, "wall_time": wall_time, "peak_bytes": peak,
+                           "overlapping": not exclusive, "allocations": allocations}, f)
+            logger.info(f"Profiled stage '{stage}': {wall_time:.2f}s, peak memory {peak / (1024 * 1024):.1f} MB")
+        except Exception as e:
+            logger.error(f"Failed to write profile for stage '{stage}': {str(e)}")
+        finally:
+            _release_tracing()
+
+def profiled_call(stage, profile_dir, func, *args, **kwargs):
+    """
+    Run func under profile_stage. Module-level so it can be sent to executor
+    workers (threads or processes) and profile the work where it actually runs.
+    """
+    with profile_stage(stage, profile_dir):
+        return func(*args, **kwargs)
+
+def summarize_profiles(profile_dir):
+    """
+    Merge the per-stage profiles of a run into summary.txt: wall time and memory
+    peak per stage, top functions by cumulative time and top allocation sites.
+    Returns the summary path.
+    """
+    stages = {}
+    for meta_path in sorted(glob.glob(os.path.join(profile_dir, "*.json"))):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        entry = stages.setdefault(meta["stage"], {"wall_time": 0, "peak_bytes": 0, "overlapping": False,
+                                                  "allocations": {}, "profiles": []})
+        entry["wall_time"] += meta["wall_time"]
+        entry["overlapping"] = entry["overlapping"] or meta.get("overlapping", False)
+        entry["peak_bytes"] = max(entry["peak_bytes"], meta["peak_bytes"])
+        for allocation in meta["allocations"]:
+            entry["allocations"][allocation["site"]] = entry["allocations"].get(allocation["site"], 0) + allocation["size"]
+        prof_path = meta_path[:-len(".json")] + ".prof"
+        if os.path.exists(prof_path):
+            entry["profiles"].append(prof_path)
+
+    out = io.StringIO()
+    for stage, entry in stages.items():
+        shared = " (shared with overlapping stages)" if entry["overlapping"] else ""
+        out.write(f"=== {stage}: {entry['wall_time']:.2f}s, peak memory {entry['peak_bytes'] / (1024 * 1024):.1f} MB{shared} ===\n\n")
+        if entry["profiles"]:
+            out.write(f"Top {TOP_FUNCTIONS} functions by cumulative time:\n")
+            stats = pstats.Stats(*entry["profiles"], stream=out)
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        out.write(f"Top {TOP_ALLOCATIONS} allocation sites (live at end of stage):\n")
+        top_sites = sorted(entry["allocations"].items(), key=lambda item: item[1], reverse=True)[:TOP_ALLOCATIONS]
+        for site, size in top_sites:
+            out.write(f"  {size / 1024:10.1f} KB  {site}\n")
+        out.write("\n")
+
+    summary_path = os.path.join(profile_dir, "summary.txt")
+    with open(summary_path, "w") as f:
+        f.write(out.getvalue())
+    logger.info(f"Profile summary written to {summary_path}")
+    return summary_path
@@ -1,13 +1,23 @@
 from moviepy.editor import VideoFileClip
-from utils import get_video_duration, create_temp_file, logger
+from utils import get_video_duration, create_temp_file, logger, probe_video, validation_enabled
 import time
 import os
 
-def segment_video(video_path, segment_length=300):
+def segment_video(video_path, segment_length=300, validate=None, windows=None,
+                  max_height=None, fps=None, audio_bitrate=None):
     """
     Split video into segments of specified length (default 5 minutes = 300 seconds)
     Returns list of paths to segmented videos
+    
+    validate: check each written segment kept its audio track (defaults to
+    off in trusted fast mode, see utils.validation_enabled)
+    windows: optional list of (start, end) times to cut instead of fixed-length segments
+    max_height, fps, audio_bitrate: optional proxy encoding settings; the
+    segments are downscaled by ffmpeg while they are written
     """
+    if validate is None:
+        validate = validation_enabled()
+    
     logger.info(f"Starting video segmentation process for {video_path}")
     logger.info(f"Segment length: {segment_length} seconds")
     
@@ -17,25 +27,34 @@ def segment_video(video_path, segment_length=300):
         # Get video information
         clip = VideoFileClip(video_path, audio=True)  # Explicitly load audio
         duration = clip.duration
-        fps = clip.fps
+        source_fps = clip.fps
         size = clip.size
         has_audio = clip.audio is not None
         
-        logger.info(f"Video loaded: duration={duration:.2f}s, fps={fps}, size={size}, has_audio={has_audio}")
+        logger.info(f"Video loaded: duration={duration:.2f}s, fps={source_fps}, size={size}, has_audio={has_audio}")
         
         if not has_audio:
             logger.warning("Input video does not have audio track")
         
+        if windows is None:
+            windows = [(start_t, start_t + segment_length) for start_t in range(0, int(duration), segment_length)]
+        
+        # Proxy encoding settings are applied by ffmpeg while writing
+        ffmpeg_params = ["-vf", f"scale=-2:{max_height}"] if max_height else None
+        
         segment_paths = []
-        total_segments = (int(duration) + segment_length - 1) // segment_length  # Ceiling division
+        total_segments = len(windows)
         logger.info(f"Splitting video into {total_segments} segments")
         
-        for i, start_t in enumerate(range(0, int(duration), segment_length)):
+        for i, (start_t, end_t) in enumerate(windows):
             segment_start = time.time()
             
-            end_t = min(start_t + segment_length, duration)
+            start_t = max(0, start_t)
+            end_t = min(end_t, duration)
             logger.info(f"Creating segment {i+1}/{total_segments}: {start_t}s to {end_t}s (duration: {end_t-start_t:.2f}s)")
             
+            segment_path = None
+            written = False
             try:
                 # Extract the segment
                 segment = clip.subclip(start_t, end_t)
@@ -51,32 +70,39 @@ def segment_video(video_path, segment_length=300):
                 # Write segment to file with progress reporting
                 segment.write_videofile(
                     segment_path, 
+                    fps=fps,
                     codec='libx264',
                     audio_codec='aac',  # Use AAC for better compatibility
+                    audio_bitrate=audio_bitrate,
                     temp_audiofile=f"{segment_path}.temp-audio.m4a",  # Temp file for audio
                     remove_temp=True,  # Remove temp audio file when done
+                    ffmpeg_params=ffmpeg_params,
                     logger=None  # Disable moviepy's logger to avoid spam
                 )
                 
                 segment_paths.append((segment_path, start_t, end_t))
+                written = True
                 segment_time = time.time() - segment_start
                 logger.info(f"Segment {i+1} created successfully in {segment_time:.2f}s")
                 
                 # Check file size and validate audio
                 file_size_mb = os.path.getsize(segment_path) / (1024 * 1024)
-                logger.debug(f"Segment file size: {file_size_mb:.2f} MB")
+                logger.debug("Segment file size: %.2f MB", file_size_mb)
                 
                 # Validate that the segment has audio if original did
-                if has_audio:
-                    validation_clip = VideoFileClip(segment_path)
-                    if validation_clip.audio is None:
+                if has_audio and validate:
+                    if not probe_video(segment_path)["has_audio"]:
                         logger.warning(f"Segment {i+1} is missing audio! Original had audio but segment does not.")
                     else:
-                        logger.debug(f"Segment {i+1} audio validation passed")
-                    validation_clip.close()
+                        logger.debug("Segment %s audio validation passed", i+1)
                 
             except Exception as e:
                 logger.error(f"Failed to create segment {i+1}: {str(e)}")
+                # Partial files are never registered, so nothing else would remove them
+                if segment_path and not written:
+                    for path in (segment_path, f"{segment_path}.temp-audio.m4a"):
+                        if os.path.exists(path):
+                            os.remove(path)
                 # Continue with other segments even if one fails
         
         # Close the original clip
@@ -95,4 +121,16 @@ def segment_video(video_path, segment_length=300):
                 clip.close()
             except:
                 pass
-        return [] 
\ No newline at end of file
+        return [] 
+
+def plan_segments(video_path, segment_length=300):
+    """
+    Split the source video into time windows without encoding anything.
+    Returns list of (video_path, start, end) tuples over the original file,
+    for analysis modes that read frames straight from the source.
+    """
+    duration = get_video_duration(video_path)
+    windows = [(video_path, start_t, min(start_t + segment_length, duration))
+               for start_t in range(0, int(duration), segment_length)]
+    logger.info(f"Planned {len(windows)} analysis windows of {segment_length}s over {video_path}")
+    return windows
@@ -0,0 +1,83 @@
+import os
+import time
+import pytest
+import artifact_store
+from artifact_store import (begin_run, end_run, register_artifact, enforce_quota,
+                            release_stale_intermediates, total_bytes)
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    """Empty artifact folders and a fresh index for every test"""
+    folders = {}
+    for kind in ('segments', 'output', 'uploads'):
+        folders[kind] = str(tmp_path / kind)
+        os.makedirs(folders[kind])
+    monkeypatch.setattr(artifact_store, "FOLDERS", folders)
+    monkeypatch.setattr(artifact_store, "_artifacts", {})
+    monkeypatch.setattr(artifact_store, "_active_runs", set())
+    monkeypatch.setattr(artifact_store, "_scanned", False)
+    return folders
+
+def write(folder, name, size, age=0):
+    """Create a file of size bytes last modified age seconds ago; returns its path"""
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    if age:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    return path
+
+def test_enforce_quota_evicts_least_recently_used_first(store):
+    old = register_artifact(write(store['output'], "old.mp4", 100), "run-1", kind='output')
+    new = register_artifact(write(store['output'], "new.mp4", 100), "run-2", kind='output')
+    artifact_store._artifacts[os.path.abspath(old)]["last_access"] -= 60
+
+    assert enforce_quota(150) == 100
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+    assert total_bytes() == 100
+
+def test_enforce_quota_keeps_outputs_of_active_runs(store):
+    begin_run("active")
+    output = register_artifact(write(store['output'], "reel.mp4", 100), "active", kind='output')
+
+    assert enforce_quota(10) == 0
+    assert os.path.exists(output)
+
+    end_run("active")
+    assert enforce_quota(10) == 100
+    assert not os.path.exists(output)
+
+def test_enforce_quota_never_evicts_segments(store):
+    segment = register_artifact(write(store['segments'], "segment_0.mp4", 100), "run-1")
+
+    assert enforce_quota(10) == 0
+    assert os.path.exists(segment)
+
+def test_begin_run_protects_inputs_until_run_ends(store):
+    upload = register_artifact(write(store['uploads'], "match.mp4", 100), kind='uploads')
+    begin_run("reader", inputs=[upload])
+
+    assert enforce_quota(10) == 0
+    assert os.path.exists(upload)
+
+    end_run("reader")
+    assert enforce_quota(10) == 100
+    assert not os.path.exists(upload)
+
+def test_files_left_by_earlier_processes_count_towards_quota(store):
+    write(store['output'], "earlier.mp4", 100)
+
+    assert total_bytes() == 100
+    assert enforce_quota(10) == 100
+
+def test_stale_adopted_segments_are_released(store):
+    stale = write(store['segments'], "stale.mp4", 100, age=3600)
+    recent = write(store['segments'], "recent.mp4", 100)
+    own = register_artifact(write(store['segments'], "own.mp4", 100, age=3600), "run-1")
+
+    assert release_stale_intermediates(max_age=600) == 100
+    assert not os.path.exists(stale)
+    assert os.path.exists(recent)
+    assert os.path.exists(own)
@@ -0,0 +1,24 @@
+import os
+import pytest
+from batch_cli import result_paths
+
+def test_unique_names_keep_the_video_name():
+    paths = result_paths("results", ["a/match1.mp4", "b/match2.mov"])
+    assert paths == {"a/match1.mp4": os.path.join("results", "match1.json"),
+                     "b/match2.mov": os.path.join("results", "match2.json")}
+
+def test_shared_names_get_distinct_files():
+    videos = ["day1/match.mp4", "day2/match.mp4", "day2/match.mov"]
+    paths = result_paths("results", videos)
+    assert len(set(paths.values())) == 3
+    for video in videos:
+        name = os.path.basename(paths[video])
+        assert name.startswith("match-") and name.endswith(".json")
+
+def test_names_do_not_depend_on_input_order():
+    videos = ["day1/match.mp4", "day2/match.mp4"]
+    assert result_paths("results", videos) == result_paths("results", videos[::-1])
+
+def test_duplicate_videos_are_rejected():
+    with pytest.raises(ValueError):
+        result_paths("results", ["day1/match.mp4", "day1/match.mp4"])
@@ -0,0 +1,24 @@
+from controller_agent import candidate_windows
+
+def event(timestamp, confidence=0.9):
+    return {"timestamp": timestamp, "confidence": confidence}
+
+def test_windows_are_centred_on_candidates():
+    assert candidate_windows([event(100)], 30, 0.3) == [(85, 115)]
+
+def test_overlapping_windows_are_merged():
+    windows = candidate_windows([event(130), event(100), event(300)], 30, 0.3)
+    assert windows == [(85, 145), (285, 315)]
+
+def test_touching_windows_are_merged():
+    assert candidate_windows([event(100), event(130)], 30, 0.3) == [(85, 145)]
+
+def test_windows_start_at_zero():
+    assert candidate_windows([event(5)], 30, 0.3) == [(0, 20)]
+
+def test_low_and_invalid_confidences_are_skipped():
+    events = [event(100, 0.1), event(200, None), event(300, "high"), event(400, "0.5")]
+    assert candidate_windows(events, 30, 0.3) == [(385, 415)]
+
+def test_no_candidates():
+    assert candidate_windows([], 30, 0.3) == []
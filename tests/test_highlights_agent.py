@@ -0,0 +1,32 @@
+import numpy as np
+from highlights_agent import _select_windows, _match_audio_length, main_variant_output, AUDIO_FPS
+
+def window(start, end, confidence):
+    return {"start": start, "end": end, "confidence": confidence}
+
+WINDOWS = [window(0, 20, 0.5), window(100, 130, 0.9), window(200, 220, 0.8), window(300, 340, 0.95)]
+
+def test_variants_without_limit_use_every_window():
+    assert _select_windows(WINDOWS, {"name": "full"}) == [0, 1, 2, 3]
+
+def test_limited_variant_keeps_most_confident_windows_in_match_order():
+    assert _select_windows(WINDOWS, {"name": "social", "max_duration": 70}) == [1, 3]
+
+def test_limited_variant_fills_remaining_time_with_windows_that_fit():
+    # The 30s window does not fit after the 40s one; the next 20s window does
+    assert _select_windows(WINDOWS, {"name": "social", "max_duration": 60}) == [2, 3]
+
+def test_limited_variant_can_select_nothing():
+    assert _select_windows(WINDOWS, {"name": "social", "max_duration": 10}) == []
+
+def test_main_output_follows_variant_order():
+    variants = [{"name": "events", "per_event": True}, {"name": "social", "max_duration": 60}, {"name": "full"}]
+    outputs = {"full": "full.mp4", "social": "social.mp4", "events": ["clip_0.mp4"]}
+    assert main_variant_output(variants, outputs) == "social.mp4"
+    assert main_variant_output(variants, {"events": ["clip_0.mp4"]}) is None
+
+def test_audio_is_padded_or_trimmed_to_video_length():
+    pcm = np.ones((AUDIO_FPS, 2), dtype=np.int16)
+    assert _match_audio_length(pcm, 50, 25).shape == (2 * AUDIO_FPS, 2)
+    assert not _match_audio_length(pcm, 50, 25)[AUDIO_FPS:].any()
+    assert _match_audio_length(pcm, 12, 25).shape == (int(round(12 * AUDIO_FPS / 25)), 2)
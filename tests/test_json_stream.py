@@ -0,0 +1,86 @@
+from json_stream import JSONArrayStreamParser
+
+def parse(text, chunk_size=None):
+    """Feed text in chunks of chunk_size (all at once by default); returns (items, parser)"""
+    parser = JSONArrayStreamParser()
+    chunk_size = chunk_size or len(text) or 1
+    items = []
+    for i in range(0, len(text), chunk_size):
+        items.extend(parser.feed(text[i:i + chunk_size]))
+    items.extend(parser.close())
+    return items, parser
+
+def test_well_formed_array():
+    items, parser = parse('[{"a": 1}, {"b": [1, 2]}]')
+    assert items == [{"a": 1}, {"b": [1, 2]}]
+    assert parser.found_array and parser.finished
+    assert parser.parsed == 2 and parser.malformed == 0
+
+def test_objects_complete_across_chunks():
+    text = '```json\n[{"t": 1.5, "s": "a}]b"}, {"t": 2}]\n```'
+    for chunk_size in (1, 3, 7):
+        items, _ = parse(text, chunk_size)
+        assert items == [{"t": 1.5, "s": "a}]b"}, {"t": 2}]
+
+def test_objects_returned_as_soon_as_complete():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"a": 1}, {"b"') == [{"a": 1}]
+    assert parser.feed(': 2}]') == [{"b": 2}]
+
+def test_prose_brackets_before_array_are_skipped():
+    items, parser = parse('Timestamps are in [seconds]:\n[{"a": 1}, {"b": 2}]')
+    assert items == [{"a": 1}, {"b": 2}]
+    assert parser.found_array and parser.finished
+
+def test_prose_brackets_split_across_chunks():
+    items, _ = parse('See [note 1] and [2].\n[{"a": 1}]', chunk_size=2)
+    assert items == [{"a": 1}]
+
+def test_empty_array_is_found():
+    items, parser = parse('No highlights: []')
+    assert items == []
+    assert parser.found_array and parser.finished
+
+def test_no_array():
+    items, parser = parse('Goal at 45 seconds: great strike')
+    assert items == []
+    assert not parser.found_array
+
+def test_text_after_array_is_ignored():
+    items, _ = parse('[{"a": 1}] and then {"b": 2}')
+    assert items == [{"a": 1}]
+
+def test_trailing_commas():
+    items, parser = parse('[{"a": 1, "b": [1, 2,],}, {"c": 3},]')
+    assert items == [{"a": 1, "b": [1, 2]}, {"c": 3}]
+    assert parser.malformed == 0
+
+def test_malformed_element_is_skipped():
+    items, parser = parse('[{"a": 1}, {"b": oops}, {"c": 3}]')
+    assert items == [{"a": 1}, {"c": 3}]
+    assert parser.malformed == 1
+
+def test_nested_objects_swallowed_by_broken_element_are_recovered():
+    # The first element is missing its closing brace and absorbs the rest of the array
+    items, parser = parse('[{"a": 1, {"b": 2}, {"c": 3}]')
+    assert items == [{"b": 2}, {"c": 3}]
+    assert parser.malformed == 1
+    assert parser.finished
+
+def test_truncated_response_recovers_dangling_object():
+    items, parser = parse('[{"a": 1}, {"b": 2, "c": "tex')
+    assert items == [{"a": 1}, {"b": 2, "c": "tex"}]
+    assert not parser.finished
+
+def test_truncated_nested_object():
+    items, _ = parse('[{"a": 1}, {"b": {"c": 2')
+    assert items == [{"a": 1}, {"b": {"c": 2}}]
+
+def test_truncated_unrecoverable_element_is_dropped():
+    items, parser = parse('[{"a": 1}, {"b": [1, 2')
+    assert items == [{"a": 1}]
+    assert parser.malformed == 1
+
+def test_non_object_elements_are_ignored():
+    items, _ = parse('[{"a": 1}, 5, "x", {"b": 2}]')
+    assert items == [{"a": 1}, {"b": 2}]
@@ -0,0 +1,51 @@
+import os
+import pytest
+import media_server
+from media_server import resolve_media_path, media_url
+
+@pytest.fixture
+def folders(tmp_path, monkeypatch):
+    """Served folders with one file each, plus a file outside them"""
+    folders = {kind: str(tmp_path / kind) for kind in ('segments', 'output', 'uploads')}
+    for kind, folder in folders.items():
+        os.makedirs(folder)
+        with open(os.path.join(folder, "video.mp4"), "wb") as f:
+            f.write(b"x")
+    with open(tmp_path / "secret.txt", "w") as f:
+        f.write("secret")
+    monkeypatch.setattr(media_server, "FOLDERS", folders)
+    return folders
+
+def test_files_in_served_folders_resolve(folders):
+    assert resolve_media_path("/output/video.mp4") == os.path.realpath(os.path.join(folders['output'], "video.mp4"))
+    assert resolve_media_path("/uploads/video.mp4?t=1") == os.path.realpath(os.path.join(folders['uploads'], "video.mp4"))
+
+def test_unserved_kinds_and_missing_files_are_rejected(folders):
+    assert resolve_media_path("/segments/video.mp4") is None
+    assert resolve_media_path("/output/missing.mp4") is None
+    assert resolve_media_path("/output") is None
+    assert resolve_media_path("/") is None
+
+@pytest.mark.parametrize("url_path", [
+    "/output/../secret.txt",
+    "/output/%2e%2e/secret.txt",
+    "/output/..%2fsecret.txt",
+    "/uploads/../output/../../secret.txt",
+])
+def test_path_traversal_is_rejected(folders, url_path):
+    assert resolve_media_path(url_path) is None
+
+def test_symlinks_out_of_served_folders_are_rejected(folders, tmp_path):
+    os.symlink(tmp_path / "secret.txt", os.path.join(folders['output'], "link.mp4"))
+    assert resolve_media_path("/output/link.mp4") is None
+
+def test_media_url_requires_running_server(folders, monkeypatch):
+    path = os.path.join(folders['output'], "video.mp4")
+    with pytest.raises(ValueError):
+        media_url(path)
+
+    monkeypatch.setattr(media_server, "_server", object())
+    monkeypatch.setattr(media_server, "MEDIA_BASE_URL", "http://media.example")
+    assert media_url(path) == "http://media.example/output/video.mp4"
+    with pytest.raises(ValueError):
+        media_url(os.path.join(folders['segments'], "video.mp4"))
@@ -1,44 +1,116 @@
 import os
-from moviepy.editor import VideoFileClip
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 import tempfile
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import multiprocessing
+import queue
+import threading
 import time
 import json
+from collections import OrderedDict
 from datetime import datetime
 import uuid
 
+# Log volume and rotation (DEBUG is opt-in via LOG_LEVEL=DEBUG)
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queue records unformatted so message formatting happens on the listener thread"""
+    def prepare(self, record):
+        return record
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# File and console handlers of the main process; worker processes never write the log file
+_log_handlers = []
+_worker_log_queue = None
+_worker_log_lock = threading.Lock()
+
+def _console_handler():
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+def _replace_handlers(logger, handler):
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    logger.addHandler(handler)
+
+def _detach_forked_child():
+    """
+    A forked child inherits the rotating file handler but not the listener thread.
+    Rotating the same file from several processes loses records, so the child
+    logs to the console until init_worker_logging connects it to the main process.
+    """
+    _replace_handlers(logging.getLogger('football_highlights'), _console_handler())
+
 # Configure logging
 def setup_logging():
-    """Configure and return a logger with proper formatting"""
-    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-    os.makedirs(log_dir, exist_ok=True)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(log_dir, f'highlight_detection_{timestamp}.log')
-    
+    """
+    Configure and return a logger with proper formatting.
+    Callers only enqueue records; a background listener thread formats them
+    and writes to a size-rotated file and the console.
+    """
     # Create logger
     logger = logging.getLogger('football_highlights')
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    
+    if multiprocessing.parent_process() is not None:
+        # Spawned worker: the main process owns the log file (see init_worker_logging)
+        _replace_handlers(logger, _console_handler())
+        return logger
+    
+    os.makedirs(LOG_DIR, exist_ok=True)
     
-    # Create file handler
-    file_handler = logging.FileHandler(log_file)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_file = os.path.join(LOG_DIR, f'highlight_detection_{timestamp}.log')
+    
+    # Create file handler (rotated by size)
+    file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
     file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
     
-    # Create console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
+    _log_handlers[:] = [file_handler, _console_handler()]
     
-    # Create formatter
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
+    # Hand records to a background thread so hot paths never wait on I/O
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *_log_handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
     
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_detach_forked_child)
+    
+    logger.addHandler(_DeferredQueueHandler(log_queue))
     
     return logger
 
+def worker_log_queue():
+    """
+    Multiprocessing queue that worker processes log into (see init_worker_logging).
+    Its records are written by a listener thread of this process, so only one
+    process ever writes and rotates the log file.
+    """
+    global _worker_log_queue
+    with _worker_log_lock:
+        if _worker_log_queue is None:
+            _worker_log_queue = multiprocessing.Queue()
+            listener = QueueListener(_worker_log_queue, *_log_handlers, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+    return _worker_log_queue
+
+def init_worker_logging(log_queue):
+    """Process pool initializer: send this worker's log records to the main process"""
+    # The standard QueueHandler formats the message first, so records pickle cleanly
+    _replace_handlers(logging.getLogger('football_highlights'), QueueHandler(log_queue))
+
 # Initialize logger
 logger = setup_logging()
 
@@ -64,9 +136,22 @@ def ensure_folders_exist():
         base_dir = os.path.dirname(os.path.abspath(__file__))
         logger.info(f"Using local directory for storage: {base_dir}")
     
+    # Intermediate segments can live on a RAM-backed directory (e.g. /dev/shm)
+    # since they are deleted as soon as analysis for a run is done
+    segments_dir = os.path.join(base_dir, 'football_highlights', 'segments')
+    intermediates_dir = os.environ.get('INTERMEDIATES_DIR')
+    if not intermediates_dir and os.environ.get('USE_RAM_INTERMEDIATES') == 'true':
+        if os.path.isdir('/dev/shm'):
+            intermediates_dir = '/dev/shm/football_highlights'
+        else:
+            logger.warning("USE_RAM_INTERMEDIATES is set but /dev/shm is not available")
+    if intermediates_dir:
+        segments_dir = os.path.join(intermediates_dir, 'segments')
+        logger.info(f"Using intermediates directory for segments: {segments_dir}")
+    
     # Create folders
     folders = {
-        'segments': os.path.join(base_dir, 'football_highlights', 'segments'),
+        'segments': segments_dir,
         'output': os.path.join(base_dir, 'football_highlights', 'output'),
         'uploads': os.path.join(base_dir, 'football_highlights', 'uploads')
     }
@@ -80,15 +165,64 @@ def ensure_folders_exist():
 # Initialize folders
 FOLDERS = ensure_folders_exist()
 
+# Trusted fast mode skips post-write validation of segments and outputs
+def validation_enabled():
+    """Return False when running in trusted fast mode"""
+    return os.environ.get('TRUSTED_FAST_MODE') != 'true'
+
+# Stream info cache: path -> ((mtime_ns, size), info), least recently used first
+PROBE_CACHE_SIZE = 256
+_probe_cache = OrderedDict()
+_probe_lock = threading.Lock()
+
+def probe_video(video_path):
+    """
+    Return stream info for a video without opening a full clip.
+    Runs a single ffmpeg metadata probe and caches the result per path and mtime.
+    Returns dict with duration, fps, size and has_audio.
+    """
+    stat = os.stat(video_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cache_path = os.path.abspath(video_path)
+    
+    with _probe_lock:
+        cached = _probe_cache.get(cache_path)
+        if cached and cached[0] == key:
+            _probe_cache.move_to_end(cache_path)
+            return cached[1]
+    
+    start_time = time.time()
+    infos = ffmpeg_parse_infos(video_path)
+    info = {
+        "duration": infos.get("duration"),
+        "fps": infos.get("video_fps"),
+        "size": infos.get("video_size"),
+        "has_audio": bool(infos.get("audio_found"))
+    }
+    
+    with _probe_lock:
+        _probe_cache[cache_path] = (key, info)
+        _probe_cache.move_to_end(cache_path)
+        while len(_probe_cache) > PROBE_CACHE_SIZE:
+            _probe_cache.popitem(last=False)
+    logger.debug("Probed %s in %.3fs: %s", video_path, time.time() - start_time, info)
+    return info
+
+def forget_probe(path):
+    """Drop cached stream info for a deleted file, or for every file under a deleted directory"""
+    path = os.path.abspath(path)
+    prefix = os.path.join(path, '')
+    with _probe_lock:
+        for cached_path in [p for p in _probe_cache if p == path or p.startswith(prefix)]:
+            del _probe_cache[cached_path]
+
 def get_video_duration(video_path):
     """Get duration of video in seconds"""
     logger.info(f"Getting duration for video: {video_path}")
     start_time = time.time()
     
     try:
-        clip = VideoFileClip(video_path)
-        duration = clip.duration
-        clip.close()
+        duration = probe_video(video_path)["duration"]
         
         elapsed = time.time() - start_time
         logger.info(f"Video duration: {duration:.2f} seconds (operation took {elapsed:.2f}s)")
@@ -110,16 +244,25 @@ def create_temp_file(suffix=".mp4", folder_type='segments'):
         filename = f"{timestamp}_{unique_id}{suffix}"
         file_path = os.path.join(FOLDERS[folder_type], filename)
         
-        logger.debug(f"Created file path: {file_path}")
+        logger.debug("Created file path: %s", file_path)
         return file_path
     except Exception as e:
         logger.error(f"Failed to create file path: {str(e)}")
         # Fallback to temporary file if there's an error
         fd, path = tempfile.mkstemp(suffix=suffix)
         os.close(fd)
-        logger.debug(f"Created fallback temporary file: {path}")
+        logger.debug("Created fallback temporary file: %s", path)
         return path
 
+def create_output_dir(prefix="hls"):
+    """Create a uniquely named directory in the output folder"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    unique_id = str(uuid.uuid4())[:8]
+    dir_path = os.path.join(FOLDERS['output'], f"{prefix}_{timestamp}_{unique_id}")
+    os.makedirs(dir_path, exist_ok=True)
+    logger.debug("Created output directory: %s", dir_path)
+    return dir_path
+
 def save_uploaded_file(uploaded_file):
     """Save an uploaded file to the uploads folder"""
     try:
@@ -150,21 +293,43 @@ def log_api_request(model, prompt, is_multimodal=False):
     """Log information about an API request"""
     logger.info(f"API Request - Model: {model}")
     logger.info(f"API Request - Multimodal: {is_multimodal}")
-    logger.debug(f"API Request - Prompt: {prompt[:500]}...")
+    logger.debug("API Request - Prompt: %s...", prompt[:500])
 
 def log_api_response(response_text, elapsed_time):
     """Log information about an API response"""
     logger.info(f"API Response received in {elapsed_time:.2f}s")
     # Truncate very long responses to avoid huge log files
     if len(response_text) > 1000:
-        logger.debug(f"API Response (truncated): {response_text[:1000]}...")
+        logger.debug("API Response (truncated): %s...", response_text[:1000])
     else:
-        logger.debug(f"API Response: {response_text}")
+        logger.debug("API Response: %s", response_text)
 
 def log_json_data(data, prefix=""):
-    """Log a JSON object in a readable format"""
+    """Log a JSON object at DEBUG level (serialized only when DEBUG is enabled)"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     try:
-        formatted_json = json.dumps(data, indent=2)
-        logger.debug(f"{prefix}\n{formatted_json}")
+        logger.debug("%s %s", prefix, json.dumps(data, separators=(',', ':')))
     except Exception as e:
-        logger.error(f"Failed to log JSON data: {str(e)}") 
\ No newline at end of file
+        logger.error(f"Failed to log JSON data: {str(e)}")
+
+def tail_log(log_path, max_bytes=64 * 1024):
+    """Return at most the last max_bytes of a log file, starting at a line boundary"""
+    with open(log_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - max_bytes))
+        data = f.read()
+    if size > max_bytes:
+        # Drop the partial first line
+        data = data.split(b'\n', 1)[-1]
+    return data.decode('utf-8', errors='replace')
+
+def latest_log_file():
+    """Return the path of the most recently written log file, or None"""
+    if not os.path.isdir(LOG_DIR):
+        return None
+    log_files = [os.path.join(LOG_DIR, f) for f in os.listdir(LOG_DIR) if f.endswith('.log')]
+    if not log_files:
+        return None
+    return max(log_files, key=os.path.getmtime)